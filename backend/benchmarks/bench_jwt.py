@@ -0,0 +1,36 @@
+"""Microbenchmark: JWT verification backends and the decoded-token cache
+
+Run from backend/:  python -m benchmarks.bench_jwt [--iterations 20000]
+"""
+import argparse
+import timeit
+
+from services import auth_service
+
+
+def _report(label: str, seconds: float, iterations: int):
+    print(f"{label:<32} {seconds / iterations * 1e6:8.2f} µs/op")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    token, _, _ = auth_service.create_tokens("bench-user", "bench@artywiz.io")
+    n = args.iterations
+
+    _report("python-jose decode", timeit.timeit(
+        lambda: auth_service._decode_jwt(token, backend="jose"), number=n), n)
+
+    _report("pyjwt decode", timeit.timeit(
+        lambda: auth_service._decode_jwt(token, backend="pyjwt"), number=n), n)
+
+    auth_service.decoded_token_cache.clear()
+    auth_service.decode_token(token)
+    _report("decode_token (cache hit)", timeit.timeit(
+        lambda: auth_service.decode_token(token), number=n), n)
+
+
+if __name__ == "__main__":
+    main()
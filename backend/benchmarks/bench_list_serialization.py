@@ -0,0 +1,84 @@
+"""Microbenchmark: per-item cost of serializing list responses
+
+Compares the previous path (model per document, then FastAPI's response_model
+validation and jsonable_encoder) with the DocumentShape + orjson fast path,
+on ledger entries as they come back from Mongo.
+
+Run from backend/:  python -m benchmarks.bench_list_serialization [--items 100] [--iterations 200]
+"""
+import argparse
+import json
+import timeit
+import uuid
+from datetime import datetime, timedelta
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from models.atc_models import ATCLedgerEntry, ATCLedgerResponse, ATCTransactionType
+from services.fast_json import DocumentShape
+
+
+def _documents(count: int) -> list:
+    now = datetime.utcnow()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": "bench-user",
+            "transaction_type": ATCTransactionType.PURCHASE.value,
+            "amount": 10.0 + i,
+            "balance_after": 100.0 + i,
+            "atc_price_eur": 0.1,
+            "value_eur": 1.0 + i / 10,
+            "source_type": "purchase",
+            "source_id": str(uuid.uuid4()),
+            "description": f"Achat de {10 + i} ATC",
+            "metadata": {"amount_eur": 1.0},
+            "is_locked": False,
+            "unlock_date": None,
+            "created_at": now - timedelta(minutes=i),
+        }
+        for i in range(count)
+    ]
+
+
+def _report(label: str, seconds: float, iterations: int, items: int):
+    print(f"{label:<36} {seconds / (iterations * items) * 1e6:8.2f} µs/item")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    docs = _documents(args.items)
+    n = args.iterations
+    response_adapter = TypeAdapter(ATCLedgerResponse)
+    shape = DocumentShape(ATCLedgerEntry)
+
+    def previous_path():
+        # Route builds the models, FastAPI re-validates against response_model and encodes
+        response = ATCLedgerResponse(
+            entries=[ATCLedgerEntry(**doc) for doc in docs],
+            total_count=len(docs), page=1, page_size=len(docs), has_more=False,
+        )
+        validated = response_adapter.validate_python(response, from_attributes=True)
+        return json.dumps(jsonable_encoder(validated)).encode()
+
+    def fast_path():
+        entries = shape.prepare_all([dict(doc) for doc in docs])
+        return orjson.dumps({
+            "entries": entries,
+            "total_count": len(docs), "page": 1, "page_size": len(docs), "has_more": False,
+        })
+
+    assert json.loads(previous_path()) == json.loads(fast_path())
+
+    _report("models + response_model + json", timeit.timeit(previous_path, number=n), n, args.items)
+    _report("DocumentShape + orjson", timeit.timeit(fast_path, number=n), n, args.items)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""ASGI middleware compressing responses with Brotli or gzip
+
+Only complete (non-streaming) responses of a compressible content type and at
+least `COMPRESSION_MIN_SIZE` bytes are compressed; responses that already
+carry a Content-Encoding, media and streamed bodies pass through untouched.
+Levels trade CPU for bytes:
+
+- COMPRESSION_MIN_SIZE (default 1024 bytes)
+- COMPRESSION_BROTLI_QUALITY (0-11, default 4)
+- COMPRESSION_GZIP_LEVEL (1-9, default 6)
+"""
+from typing import Optional
+import gzip
+import os
+
+import brotli
+
+COMPRESSIBLE_TYPES = (
+    "text/", "application/json", "application/javascript", "application/xml", "image/svg+xml",
+)
+COMPRESSIBLE_SUFFIXES = ("+json", "+xml")
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return media_type.startswith(COMPRESSIBLE_TYPES) or media_type.endswith(COMPRESSIBLE_SUFFIXES)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick "br" or "gzip" from an Accept-Encoding header (q=0 refuses a coding)"""
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            accepted[coding.strip()] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    candidates = [(accepted.get(coding, wildcard), -rank, coding) for rank, coding in enumerate(("br", "gzip"))]
+    quality, _, coding = max(candidates)
+    return coding if quality > 0 else None
+
+
+class CompressionMiddleware:
+    """Negotiates Brotli / gzip for buffered responses above a size threshold"""
+
+    def __init__(
+        self,
+        app,
+        minimum_size: Optional[int] = None,
+        brotli_quality: Optional[int] = None,
+        gzip_level: Optional[int] = None
+    ):
+        self.app = app
+        self.minimum_size = minimum_size if minimum_size is not None else int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+        self.brotli_quality = brotli_quality if brotli_quality is not None else int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+        self.gzip_level = gzip_level if gzip_level is not None else int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = negotiate_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = {name.lower(): value for name, value in message.get("headers", [])}
+                content_length = headers.get(b"content-length")
+                if (
+                    message["status"] < 200 or message["status"] in (204, 304)
+                    or b"content-encoding" in headers
+                    or not is_compressible(headers.get(b"content-type", b"").decode("latin-1"))
+                    or (content_length is not None and int(content_length) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Hold the headers until we know whether the body is streamed
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = self.compress(body, encoding)
+            headers = [
+                (name, value) for name, value in start_message.get("headers", [])
+                if name.lower() not in (b"content-length", b"vary")
+            ]
+            vary = [value for name, value in start_message.get("headers", []) if name.lower() == b"vary"]
+            if b"accept-encoding" not in b",".join(vary).lower():
+                vary.append(b"Accept-Encoding")
+            headers += [
+                (b"content-encoding", encoding.encode("latin-1")),
+                (b"content-length", str(len(compressed)).encode("latin-1")),
+                (b"vary", b", ".join(vary)),
+            ]
+            await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,39 @@
+"""ASGI middleware recording per-route request latency"""
+import time
+
+from services.metrics import http_request_duration
+
+# Label used for requests that matched no route (404s, scanners...)
+UNMATCHED_ROUTE = "unmatched"
+
+
+class MetricsMiddleware:
+    """Observes request duration labelled by method, route template and status"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched route in the (shared) scope
+            route = scope.get("route")
+            http_request_duration.labels(
+                method=scope["method"],
+                route=getattr(route, "path", UNMATCHED_ROUTE),
+                status=str(status_code)
+            ).observe(time.perf_counter() - started_at)
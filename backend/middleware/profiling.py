@@ -0,0 +1,139 @@
+"""On-demand profiling of single requests (pyinstrument)
+
+Only installed when PROFILING_ENABLED is set, so it costs nothing otherwise.
+A request is profiled when it carries an admin access token in the
+`X-Profile` header (never in the URL, where it would end up in access logs
+and browser history):
+
+- by default the original response is returned and the HTML report is
+  written to PROFILE_DIR, its file name in the `X-Profile-Report` header;
+- with `X-Profile-Output: html` the report replaces the response.
+
+At most PROFILING_MAX_CONCURRENT requests are profiled at once; others run
+unprofiled with `X-Profile-Skipped: busy`.
+"""
+from datetime import datetime
+from pathlib import Path
+import asyncio
+import logging
+import os
+import uuid
+
+from fastapi import HTTPException
+from pyinstrument import Profiler
+
+from models.user import UserRole
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_OUTPUT_HEADER = b"x-profile-output"
+
+
+def profiling_enabled() -> bool:
+    return os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+
+async def _is_admin(token: str) -> bool:
+    # Imported lazily: routes import the app's services at module load
+    from routes.users_routes import get_current_user
+
+    try:
+        principal = await get_current_user(authorization=f"Bearer {token}")
+    except HTTPException:
+        return False
+    return principal.role == UserRole.ADMIN
+
+
+class ProfilingMiddleware:
+    """Runs flagged requests from admins under a sampling profiler"""
+
+    def __init__(self, app, max_concurrent: int = None, profile_dir: str = None, interval: float = None):
+        self.app = app
+        self.max_concurrent = max_concurrent or int(os.getenv("PROFILING_MAX_CONCURRENT", "2"))
+        self.profile_dir = Path(profile_dir or os.getenv("PROFILE_DIR", "/tmp/artywiz-profiles"))
+        self.interval = interval or float(os.getenv("PROFILING_INTERVAL_SECONDS", "0.001"))
+        self.active = 0
+
+    def _flags(self, scope):
+        token = output = None
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                token = value.decode("latin-1")
+            elif name == PROFILE_OUTPUT_HEADER:
+                output = value.decode("latin-1")
+        return token, output
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token, output = self._flags(scope)
+        if not token or not await _is_admin(token):
+            await self.app(scope, receive, send)
+            return
+
+        if self.active >= self.max_concurrent:
+            await self.app(scope, receive, _with_headers(send, [(b"x-profile-skipped", b"busy")]))
+            return
+
+        self.active += 1
+        try:
+            await self._profile(scope, receive, send, output == "html")
+        finally:
+            self.active -= 1
+
+    async def _profile(self, scope, receive, send, return_html: bool):
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        # Buffered: the report header must be added to the response start
+        messages = []
+
+        async def buffer_send(message):
+            messages.append(message)
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, buffer_send)
+        finally:
+            profiler.stop()
+
+        html = profiler.output_html()
+        if return_html:
+            body = html.encode()
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/html; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        report_name = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}.html"
+        try:
+            # File I/O off the event loop
+            await asyncio.to_thread(self._write_report, report_name, html)
+            logger.info(f"Profile of {scope['method']} {scope['path']} written to {report_name}")
+            extra_headers = [(b"x-profile-report", report_name.encode())]
+        except OSError as e:
+            logger.error(f"Could not write profile report: {e}")
+            extra_headers = [(b"x-profile-skipped", b"write-failed")]
+
+        replay = _with_headers(send, extra_headers)
+        for message in messages:
+            await replay(message)
+
+    def _write_report(self, report_name: str, html: str):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        (self.profile_dir / report_name).write_text(html)
+
+
+def _with_headers(send, extra_headers: list):
+    async def send_with_headers(message):
+        if message["type"] == "http.response.start":
+            message = {**message, "headers": [*message.get("headers", []), *extra_headers]}
+        await send(message)
+    return send_with_headers
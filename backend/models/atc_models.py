@@ -30,6 +30,7 @@ class ATCPurchaseStatus(str, Enum):
     COMPLETED = "completed"     # ATC crédités
     FAILED = "failed"           # Échec
     CANCELLED = "cancelled"     # Annulé
+    NEEDS_REVIEW = "needs_review"  # Crédit du wallet incertain, à vérifier avant toute reprise
 
 
 # ============================================================
@@ -197,6 +198,7 @@ class ATCPurchaseRequest(BaseModel):
     
     # Statut
     status: ATCPurchaseStatus = ATCPurchaseStatus.PENDING
+    credit_error: Optional[str] = None  # Erreur ayant laissé la demande en needs_review
     
     # Timestamps
     created_at: datetime = Field(default_factory=datetime.utcnow)
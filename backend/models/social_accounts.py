@@ -38,6 +38,9 @@ class SocialPostDB(BaseModel):
     error_message: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     published_at: Optional[datetime] = None
+    # Set when a shutdown interrupted the publish (stage, platform ids if already posted)
+    interrupted_at: Optional[datetime] = None
+    resume_state: Optional[dict] = None
 
 
 class ConnectAccountRequest(BaseModel):
@@ -72,3 +75,22 @@ class SocialAccountResponse(BaseModel):
     picture_url: Optional[str] = None
     is_active: bool
     connected_at: datetime
+
+
+class SocialPostResponse(BaseModel):
+    """Public response for publish history (without resume state)"""
+    id: str
+    user_id: str
+    account_id: str
+    platform: str
+    document_id: str
+    content: str
+    image_url: Optional[str] = None
+    platform_post_id: Optional[str] = None
+    platform_post_url: Optional[str] = None
+    status: str = "pending"
+    error_message: Optional[str] = None
+    created_at: datetime
+    published_at: Optional[datetime] = None
+    insights: Optional[dict] = None
+    insights_updated_at: Optional[datetime] = None
@@ -1,6 +1,6 @@
 """User model for Artywiz authentication"""
 from pydantic import BaseModel, Field, EmailStr, field_validator
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 from enum import Enum
 import uuid
@@ -25,7 +25,8 @@ class UserProfile(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     type: ProfileType
     name: str
-    logo: Optional[str] = None  # Base64 encoded
+    logo: Optional[str] = None  # Base64 on upload, stored as a media URL
+    logo_thumbnails: Optional[Dict[str, str]] = None  # size -> URL
     club_id: Optional[str] = None  # For equipe profiles
     numero: Optional[str] = None
     is_active: bool = True
@@ -59,7 +60,7 @@ class UserLogin(BaseModel):
 class UserUpdate(BaseModel):
     """User update request"""
     name: Optional[str] = None
-    avatar: Optional[str] = None  # Base64 encoded
+    avatar: Optional[str] = None  # Base64 on upload, stored as a media URL
     phone: Optional[str] = None
 
 
@@ -82,6 +83,7 @@ class UserInDB(UserBase):
     
     # Metadata
     avatar: Optional[str] = None
+    avatar_thumbnails: Optional[Dict[str, str]] = None
     phone: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -91,6 +93,17 @@ class UserInDB(UserBase):
         from_attributes = True
 
 
+class UserPrincipal(BaseModel):
+    """Authenticated user as resolved on each request (authorization fields only)"""
+    id: str
+    email: str
+    role: UserRole = UserRole.USER
+    is_active: bool = True
+    oauth_providers: List[str] = []
+    updated_at: Optional[datetime] = None
+    last_login: Optional[datetime] = None
+
+
 class UserResponse(BaseModel):
     """User response (safe, no password)"""
     id: str
@@ -105,6 +118,7 @@ class UserResponse(BaseModel):
     has_completed_onboarding: bool
     oauth_providers: List[str]
     avatar: Optional[str] = None
+    avatar_thumbnails: Optional[Dict[str, str]] = None
     phone: Optional[str] = None
     created_at: datetime
     last_login: Optional[datetime] = None
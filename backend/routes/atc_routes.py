@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Request, Response
+from fastapi.responses import ORJSONResponse
 from typing import Optional, List
 from datetime import datetime, timedelta
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import math
 import logging
+import os
 
 from models.atc_models import (
     ATCPriceConfig,
@@ -20,6 +24,9 @@ from models.atc_models import (
     ATCPromoConfig,
     ATCPromoViewRecord,
 )
+from services.fast_json import DocumentShape
+from services.etag import weak_etag, is_not_modified, not_modified, set_etag
+from services.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -33,12 +40,23 @@ def set_db(database: AsyncIOMotorDatabase):
     db = database
 
 
+# Config de prix et promos en cours, lues à chaque requête ATC. Les autres
+# workers les invalident via le bus de changements (services/cache_bus.py)
+ATC_CACHE_TTL_SECONDS = float(os.getenv("ATC_CACHE_TTL_SECONDS", "30"))
+price_config_cache = TTLCache(maxsize=1, ttl=ATC_CACHE_TTL_SECONDS)
+promo_cache = TTLCache(maxsize=1, ttl=ATC_CACHE_TTL_SECONDS)
+
+
 # ============================================================
 # HELPER FUNCTIONS
 # ============================================================
 
 async def get_or_create_price_config() -> ATCPriceConfig:
     """Récupère ou crée la configuration de prix ATC"""
+    cached = price_config_cache.get("active")
+    if cached is not None:
+        return cached
+    
     config = await db.atc_price_config.find_one({"is_active": True})
     
     if not config:
@@ -49,7 +67,25 @@ async def get_or_create_price_config() -> ATCPriceConfig:
         await db.atc_price_config.insert_one(default_config.dict())
         return default_config
     
-    return ATCPriceConfig(**config)
+    config = ATCPriceConfig(**config)
+    price_config_cache.set("active", config)
+    return config
+
+
+async def get_active_promo(now: datetime) -> Optional[dict]:
+    """Promo active à `now` (les promos non terminées sont en cache, les dates filtrées ici)"""
+    promos = promo_cache.get("unfinished")
+    if promos is None:
+        promos = await db.atc_promos.find(
+            {"is_active": True, "end_date": {"$gte": now}},
+            {"_id": 0}
+        ).to_list(100)
+        promo_cache.set("unfinished", promos)
+    
+    for promo in promos:
+        if promo["start_date"] <= now <= promo["end_date"]:
+            return promo
+    return None
 
 
 def calculate_current_price(config: ATCPriceConfig) -> float:
@@ -81,28 +117,67 @@ def calculate_next_price_date(config: ATCPriceConfig) -> datetime:
 
 async def get_or_create_wallet(user_id: str) -> ATCWallet:
     """Récupère ou crée le wallet d'un utilisateur"""
-    wallet = await db.atc_wallets.find_one({"user_id": user_id})
+    wallet = await db.atc_wallets.find_one({"user_id": user_id}, {"_id": 0})
     
     if not wallet:
-        # Créer un nouveau wallet
+        # Créer un nouveau wallet par upsert : deux premières lectures concurrentes
+        # n'en créent qu'un (index unique sur user_id)
         config = await get_or_create_price_config()
         
         new_wallet = ATCWallet(
             user_id=user_id,
             unlock_date=config.launch_date + timedelta(days=config.vesting_months * 30)
         )
-        await db.atc_wallets.insert_one(new_wallet.dict())
-        return new_wallet
+        on_insert = {key: value for key, value in new_wallet.dict().items() if key != "user_id"}
+        try:
+            wallet = await db.atc_wallets.find_one_and_update(
+                {"user_id": user_id}, {"$setOnInsert": on_insert},
+                projection={"_id": 0}, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Un autre upsert a créé le wallet entre-temps
+            wallet = await db.atc_wallets.find_one({"user_id": user_id}, {"_id": 0})
     
     return ATCWallet(**wallet)
 
 
+async def increment_wallet(user_id: str, increments: dict, config: ATCPriceConfig) -> ATCWallet:
+    """Applique `increments` ($inc) au wallet, créé au besoin, et renvoie le wallet après mise à jour
+    
+    Une seule opération atomique : les crédits concurrents ne se perdent pas et
+    le solde renvoyé est exactement celui produit par cette opération.
+    """
+    now = datetime.utcnow()
+    new_wallet = ATCWallet(
+        user_id=user_id,
+        unlock_date=config.launch_date + timedelta(days=config.vesting_months * 30)
+    )
+    on_insert = {
+        key: value for key, value in new_wallet.dict().items()
+        if key not in increments and key not in ("user_id", "updated_at")
+    }
+    update = {"$inc": increments, "$set": {"updated_at": now}, "$setOnInsert": on_insert}
+    
+    try:
+        wallet = await db.atc_wallets.find_one_and_update(
+            {"user_id": user_id}, update,
+            projection={"_id": 0}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Un autre upsert a créé le wallet entre-temps : il existe désormais
+        wallet = await db.atc_wallets.find_one_and_update(
+            {"user_id": user_id}, update,
+            projection={"_id": 0}, return_document=ReturnDocument.AFTER
+        )
+    return ATCWallet(**wallet)
+
+
 # ============================================================
 # ENDPOINTS - CONFIGURATION
 # ============================================================
 
 @router.get("/config", response_model=ATCConfigResponse)
-async def get_atc_config():
+async def get_atc_config(request: Request, response: Response):
     """Récupère la configuration ATC actuelle (prix, limites, promo...)"""
     try:
         config = await get_or_create_price_config()
@@ -113,11 +188,13 @@ async def get_atc_config():
         
         # Chercher une promo active
         now = datetime.utcnow()
-        active_promo = await db.atc_promos.find_one({
-            "is_active": True,
-            "start_date": {"$lte": now},
-            "end_date": {"$gte": now}
-        })
+        active_promo = await get_active_promo(now)
+        
+        # Le prix évolue avec le temps : il fait partie de la version
+        etag = weak_etag(config.id, config.updated_at, current_price, next_price_date, active_promo)
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
         
         return ATCConfigResponse(
             current_price_eur=current_price,
@@ -140,13 +217,18 @@ async def get_atc_config():
 # ============================================================
 
 @router.get("/wallet/{user_id}", response_model=ATCWalletResponse)
-async def get_wallet(user_id: str):
+async def get_wallet(user_id: str, request: Request, response: Response):
     """Récupère le wallet d'un utilisateur"""
     try:
         wallet = await get_or_create_wallet(user_id)
         config = await get_or_create_price_config()
         current_price = calculate_current_price(config)
         
+        etag = weak_etag(wallet.id, wallet.updated_at, wallet.balance_total, current_price)
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        
         return ATCWalletResponse(
             id=wallet.id,
             user_id=wallet.user_id,
@@ -171,6 +253,9 @@ async def get_wallet(user_id: str):
 # ENDPOINTS - LEDGER (HISTORIQUE)
 # ============================================================
 
+ledger_entry_shape = DocumentShape(ATCLedgerEntry)
+
+
 @router.get("/ledger/{user_id}", response_model=ATCLedgerResponse)
 async def get_ledger(
     user_id: str,
@@ -190,16 +275,17 @@ async def get_ledger(
         
         # Get entries
         skip = (page - 1) * page_size
-        cursor = db.atc_ledger.find(query).sort("created_at", -1).skip(skip).limit(page_size)
-        entries = [ATCLedgerEntry(**doc) async for doc in cursor]
-        
-        return ATCLedgerResponse(
-            entries=entries,
-            total_count=total_count,
-            page=page,
-            page_size=page_size,
-            has_more=(skip + len(entries)) < total_count
-        )
+        cursor = db.atc_ledger.find(query, ledger_entry_shape.projection).sort("created_at", -1).skip(skip).limit(page_size)
+        entries = ledger_entry_shape.prepare_all(await cursor.to_list(page_size))
+        
+        # Entries were written from ATCLedgerEntry: serialize them as stored
+        return ORJSONResponse({
+            "entries": entries,
+            "total_count": total_count,
+            "page": page,
+            "page_size": page_size,
+            "has_more": (skip + len(entries)) < total_count
+        })
     except Exception as e:
         logger.error(f"Error getting ledger for user {user_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -273,46 +359,64 @@ async def create_purchase_request(
 async def confirm_purchase(purchase_id: str):
     """Confirme un achat après paiement (appelé par webhook Stripe ou manuellement)"""
     try:
-        # Récupérer la demande d'achat
-        purchase = await db.atc_purchases.find_one({"id": purchase_id})
+        # Réserver la demande d'achat : une seule confirmation peut la faire passer de pending à completed
+        now = datetime.utcnow()
+        purchase = await db.atc_purchases.find_one_and_update(
+            {"id": purchase_id, "status": ATCPurchaseStatus.PENDING.value},
+            {
+                "$set": {
+                    "status": ATCPurchaseStatus.COMPLETED.value,
+                    "paid_at": now,
+                    "completed_at": now
+                }
+            },
+            projection={"_id": 0}
+        )
         
         if not purchase:
-            raise HTTPException(status_code=404, detail="Purchase not found")
-        
-        purchase = ATCPurchaseRequest(**purchase)
-        
-        if purchase.status != ATCPurchaseStatus.PENDING:
+            existing = await db.atc_purchases.find_one({"id": purchase_id}, {"_id": 0, "status": 1})
+            if not existing:
+                raise HTTPException(status_code=404, detail="Purchase not found")
             raise HTTPException(
                 status_code=400,
-                detail=f"Purchase already {purchase.status.value}"
+                detail=f"Purchase already {existing['status']}"
             )
         
-        # Mettre à jour le wallet
-        wallet = await get_or_create_wallet(purchase.buyer_user_id)
-        config = await get_or_create_price_config()
-        
-        new_balance_total = wallet.balance_total + purchase.amount_atc
-        new_balance_locked = wallet.balance_locked + purchase.amount_atc  # Tout est verrouillé au début
-        new_total_purchased = wallet.total_purchased + purchase.amount_atc
+        purchase = ATCPurchaseRequest(**purchase)
         
-        await db.atc_wallets.update_one(
-            {"user_id": purchase.buyer_user_id},
-            {
-                "$set": {
-                    "balance_total": new_balance_total,
-                    "balance_locked": new_balance_locked,
-                    "total_purchased": new_total_purchased,
-                    "updated_at": datetime.utcnow()
-                }
-            }
-        )
+        try:
+            # Mettre à jour le wallet (tout est verrouillé au début)
+            config = await get_or_create_price_config()
+            wallet = await increment_wallet(
+                purchase.buyer_user_id,
+                {
+                    "balance_total": purchase.amount_atc,
+                    "balance_locked": purchase.amount_atc,
+                    "total_purchased": purchase.amount_atc
+                },
+                config
+            )
+        except Exception as e:
+            # Le $inc a pu être appliqué malgré l'erreur (timeout, coupure réseau) :
+            # la demande n'est pas remise en attente, une nouvelle confirmation la
+            # créditerait deux fois. Elle est laissée à vérifier.
+            logger.error(f"Wallet credit of purchase {purchase_id} uncertain, flagged for review: {e}")
+            await db.atc_purchases.update_one(
+                {"id": purchase_id},
+                {"$set": {
+                    "status": ATCPurchaseStatus.NEEDS_REVIEW.value,
+                    "completed_at": None,
+                    "credit_error": str(e)
+                }}
+            )
+            raise
         
         # Créer l'entrée dans le ledger
         ledger_entry = ATCLedgerEntry(
             user_id=purchase.buyer_user_id,
             transaction_type=ATCTransactionType.PURCHASE,
             amount=purchase.amount_atc,
-            balance_after=new_balance_total,
+            balance_after=wallet.balance_total,
             atc_price_eur=purchase.atc_price_eur,
             value_eur=purchase.amount_eur,
             source_type="purchase",
@@ -324,22 +428,10 @@ async def confirm_purchase(purchase_id: str):
         
         await db.atc_ledger.insert_one(ledger_entry.dict())
         
-        # Mettre à jour le statut de l'achat
-        await db.atc_purchases.update_one(
-            {"id": purchase_id},
-            {
-                "$set": {
-                    "status": ATCPurchaseStatus.COMPLETED.value,
-                    "paid_at": datetime.utcnow(),
-                    "completed_at": datetime.utcnow()
-                }
-            }
-        )
-        
         return {
             "success": True,
             "message": f"{purchase.amount_atc:.2f} ATC crédités",
-            "new_balance": new_balance_total
+            "new_balance": wallet.balance_total
         }
     except HTTPException:
         raise
@@ -359,11 +451,7 @@ async def get_current_promo(user_id: str):
         now = datetime.utcnow()
         
         # Chercher une promo active
-        promo = await db.atc_promos.find_one({
-            "is_active": True,
-            "start_date": {"$lte": now},
-            "end_date": {"$gte": now}
-        })
+        promo = await get_active_promo(now)
         
         if not promo:
             return {"has_promo": False, "promo": None}
@@ -434,23 +522,13 @@ async def admin_credit_atc(
 ):
     """Crédite des ATC à un utilisateur (admin only)"""
     try:
-        wallet = await get_or_create_wallet(user_id)
         config = await get_or_create_price_config()
         current_price = calculate_current_price(config)
         
-        new_balance = wallet.balance_total + amount
-        new_earned = wallet.total_earned + amount
-        
-        await db.atc_wallets.update_one(
-            {"user_id": user_id},
-            {
-                "$set": {
-                    "balance_total": new_balance,
-                    "balance_locked": wallet.balance_locked + amount,
-                    "total_earned": new_earned,
-                    "updated_at": datetime.utcnow()
-                }
-            }
+        wallet = await increment_wallet(
+            user_id,
+            {"balance_total": amount, "balance_locked": amount, "total_earned": amount},
+            config
         )
         
         # Créer l'entrée dans le ledger
@@ -458,7 +536,7 @@ async def admin_credit_atc(
             user_id=user_id,
             transaction_type=ATCTransactionType.ADMIN_CREDIT,
             amount=amount,
-            balance_after=new_balance,
+            balance_after=wallet.balance_total,
             atc_price_eur=current_price,
             value_eur=amount * current_price,
             description=description,
@@ -470,7 +548,7 @@ async def admin_credit_atc(
         
         return {
             "success": True,
-            "new_balance": new_balance,
+            "new_balance": wallet.balance_total,
             "amount_credited": amount
         }
     except Exception as e:
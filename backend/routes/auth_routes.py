@@ -1,19 +1,29 @@
 """OAuth routes for Meta (Facebook/Instagram) authentication"""
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from fastapi.responses import RedirectResponse, HTMLResponse
 import os
-import httpx
+import logging
 from datetime import datetime, timedelta
 from urllib.parse import urlencode
-import secrets
 from dotenv import load_dotenv
 from pathlib import Path
 
+from services.oauth_state_service import create_state, consume_state
+from services.meta_discovery import fetch_pages, sync_social_accounts
+from services.http_client import create_http_client
+from services.etag import weak_etag, is_not_modified, not_modified, set_etag
+from services.task_registry import task_registry
+from services.connections_service import (
+    get_connections, get_platform_accounts, invalidate_connections
+)
+
 # Load environment variables
 load_dotenv(Path(__file__).parent.parent / '.env')
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
+logger = logging.getLogger(__name__)
+
 # Database reference (will be set from server.py)
 db = None
 
@@ -54,17 +64,8 @@ async def start_meta_auth(
         raise HTTPException(status_code=500, detail="Meta App ID not configured")
     
     # Generate state for CSRF protection
-    state = secrets.token_urlsafe(32)
-    
-    # Store state in database for verification
     # redirect_uri should be the backend callback URL (e.g., /api/auth/meta/callback)
-    await db.oauth_states.insert_one({
-        "state": state,
-        "user_id": user_id,
-        "redirect_uri": redirect_uri,
-        "created_at": datetime.utcnow(),
-        "expires_at": datetime.utcnow() + timedelta(minutes=10)
-    })
+    state = await create_state(db, user_id, redirect_uri, provider="meta")
     
     # Build authorization URL
     auth_params = {
@@ -100,11 +101,8 @@ async def meta_oauth_callback(
     if not code or not state:
         raise HTTPException(status_code=400, detail="Missing code or state")
     
-    # Verify state
-    stored_state = await db.oauth_states.find_one({
-        "state": state,
-        "expires_at": {"$gt": datetime.utcnow()}
-    })
+    # Verify and consume state (single use)
+    stored_state = await consume_state(db, state, provider="meta")
     
     if not stored_state:
         raise HTTPException(status_code=400, detail="Invalid or expired state")
@@ -112,12 +110,9 @@ async def meta_oauth_callback(
     user_id = stored_state["user_id"]
     redirect_uri = stored_state["redirect_uri"]
     
-    # Clean up used state
-    await db.oauth_states.delete_one({"state": state})
-    
     # Exchange code for access token
     config = get_meta_config()
-    async with httpx.AsyncClient() as client:
+    async with create_http_client("meta") as client:
         token_url = f"https://graph.facebook.com/{GRAPH_API_VERSION}/oauth/access_token"
         token_params = {
             "client_id": config["app_id"],
@@ -157,19 +152,16 @@ async def meta_oauth_callback(
             access_token = short_lived_token
             expires_in = 3600
         
-        # Get user's Pages and Instagram accounts
-        pages_url = f"https://graph.facebook.com/{GRAPH_API_VERSION}/me/accounts"
-        pages_params = {
-            "access_token": access_token,
-            "fields": "id,name,access_token,picture,category,instagram_business_account{id,username,profile_picture_url,name}"
-        }
-        
-        pages_response = await client.get(pages_url, params=pages_params)
-        pages_data = pages_response.json() if pages_response.status_code == 200 else {"data": []}
+        # Get user's Pages and Instagram accounts (conditional request when cached)
+        pages, pages_from_cache = await fetch_pages(client, access_token, user_id)
         
         accounts_saved = []
+        discovered_accounts = []
         
-        for page in pages_data.get("data", []):
+        for page in pages:
+            # Pages from the discovery cache carry no token: the stored one is kept
+            page_token = {} if pages_from_cache else {"access_token": page.get("access_token", access_token)}
+            
             # Save Facebook Page
             fb_account = {
                 "id": f"fb_page_{page['id']}",
@@ -179,7 +171,7 @@ async def meta_oauth_callback(
                 "name": page.get("name", "Page Facebook"),
                 "username": None,
                 "picture_url": page.get("picture", {}).get("data", {}).get("url"),
-                "access_token": page.get("access_token", access_token),
+                **page_token,
                 "platform_account_id": page["id"],
                 "is_active": True,
                 "is_default": True,
@@ -187,11 +179,7 @@ async def meta_oauth_callback(
                 "token_expires_at": datetime.utcnow() + timedelta(seconds=expires_in)
             }
             
-            await db.social_accounts.update_one(
-                {"user_id": user_id, "platform": "facebook", "platform_account_id": page["id"]},
-                {"$set": fb_account},
-                upsert=True
-            )
+            discovered_accounts.append(fb_account)
             accounts_saved.append(fb_account["name"])
             
             # Save linked Instagram Business Account
@@ -205,7 +193,7 @@ async def meta_oauth_callback(
                     "name": ig_account.get("name") or ig_account.get("username") or f"Instagram ({page.get('name')})",
                     "username": ig_account.get("username"),
                     "picture_url": ig_account.get("profile_picture_url"),
-                    "access_token": page.get("access_token", access_token),
+                    **page_token,
                     "platform_account_id": ig_account["id"],
                     "linked_facebook_page_id": page["id"],
                     "is_active": True,
@@ -214,11 +202,7 @@ async def meta_oauth_callback(
                     "token_expires_at": datetime.utcnow() + timedelta(seconds=expires_in)
                 }
                 
-                await db.social_accounts.update_one(
-                    {"user_id": user_id, "platform": "instagram", "platform_account_id": ig_account["id"]},
-                    {"$set": ig_data},
-                    upsert=True
-                )
+                discovered_accounts.append(ig_data)
                 accounts_saved.append(ig_data["name"])
         
         # Try to get WhatsApp Business accounts
@@ -278,15 +262,18 @@ async def meta_oauth_callback(
                                         "token_expires_at": datetime.utcnow() + timedelta(seconds=expires_in)
                                     }
                                     
-                                    await db.social_accounts.update_one(
-                                        {"user_id": user_id, "platform": "whatsapp", "platform_account_id": phone["id"]},
-                                        {"$set": wa_account},
-                                        upsert=True
-                                    )
+                                    discovered_accounts.append(wa_account)
                                     accounts_saved.append(f"WhatsApp: {phone.get('display_phone_number', 'N/A')}")
         except Exception as e:
             # WhatsApp access might not be available, that's okay
-            print(f"WhatsApp access not available: {e}")
+            logger.info(f"WhatsApp access not available for user {user_id}: {e}")
+    
+    # Only new or changed accounts are written (tracked: survives a cancelled request)
+    await task_registry.run(
+        sync_social_accounts(db, user_id, discovered_accounts),
+        name=f"oauth-sync:meta:{user_id}"
+    )
+    invalidate_connections(user_id)
     
     # Return success page that will close and notify parent
     accounts_list = ", ".join(accounts_saved) if accounts_saved else "Aucun compte trouvé"
@@ -326,25 +313,29 @@ async def meta_oauth_callback(
     return HTMLResponse(content=success_html)
 
 
+@router.get("/connections")
+async def get_connections_status(user_id: str = "default_user"):
+    """All connected accounts (Meta, WhatsApp, LinkedIn) grouped by platform and account type"""
+    return await get_connections(db, user_id)
+
+
 @router.get("/meta/status")
-async def get_meta_connection_status(user_id: str = "default_user"):
+async def get_meta_connection_status(request: Request, response: Response, user_id: str = "default_user"):
     """Check if user has connected Meta accounts (Facebook, Instagram, WhatsApp)"""
-    # Optimized query with projection
-    accounts = await db.social_accounts.find(
-        {
-            "user_id": user_id,
-            "platform": {"$in": ["facebook", "instagram", "whatsapp"]},
-            "is_active": True
-        },
-        {"_id": 0, "id": 1, "name": 1, "platform": 1, "picture_url": 1, "is_default": 1}
-    ).limit(100).to_list(100)
+    connections = await get_connections(db, user_id)
+    
+    # The response is derived from the (cached) overview only
+    etag = weak_etag(connections)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     
-    facebook_accounts = [a for a in accounts if a["platform"] == "facebook"]
-    instagram_accounts = [a for a in accounts if a["platform"] == "instagram"]
-    whatsapp_accounts = [a for a in accounts if a["platform"] == "whatsapp"]
+    facebook_accounts = get_platform_accounts(connections, "facebook")
+    instagram_accounts = get_platform_accounts(connections, "instagram")
+    whatsapp_accounts = get_platform_accounts(connections, "whatsapp")
     
     return {
-        "connected": len(accounts) > 0,
+        "connected": bool(facebook_accounts or instagram_accounts or whatsapp_accounts),
         "facebook": {
             "connected": len(facebook_accounts) > 0,
             "accounts": [{
@@ -384,6 +375,7 @@ async def disconnect_meta(user_id: str = "default_user"):
         {"user_id": user_id, "platform": {"$in": ["facebook", "instagram"]}},
         {"$set": {"is_active": False}}
     )
+    invalidate_connections(user_id)
     
     return {
         "success": True,
@@ -416,6 +408,7 @@ async def set_default_accounts(
             {"user_id": user_id, "id": instagram_account_id},
             {"$set": {"is_default": True}}
         )
+    invalidate_connections(user_id)
     
     return {"success": True}
 
@@ -452,17 +445,7 @@ async def start_linkedin_auth(
         raise HTTPException(status_code=500, detail="LinkedIn Client ID not configured")
     
     # Generate state for CSRF protection
-    state = secrets.token_urlsafe(32)
-    
-    # Store state in database
-    await db.oauth_states.insert_one({
-        "state": state,
-        "user_id": user_id,
-        "redirect_uri": redirect_uri,
-        "provider": "linkedin",
-        "created_at": datetime.utcnow(),
-        "expires_at": datetime.utcnow() + timedelta(minutes=10)
-    })
+    state = await create_state(db, user_id, redirect_uri, provider="linkedin")
     
     # Build authorization URL
     auth_params = {
@@ -498,12 +481,8 @@ async def linkedin_oauth_callback(
     if not code or not state:
         raise HTTPException(status_code=400, detail="Missing code or state")
     
-    # Verify state
-    stored_state = await db.oauth_states.find_one({
-        "state": state,
-        "provider": "linkedin",
-        "expires_at": {"$gt": datetime.utcnow()}
-    })
+    # Verify and consume state (single use)
+    stored_state = await consume_state(db, state, provider="linkedin")
     
     if not stored_state:
         raise HTTPException(status_code=400, detail="Invalid or expired state")
@@ -511,12 +490,9 @@ async def linkedin_oauth_callback(
     user_id = stored_state["user_id"]
     redirect_uri = stored_state["redirect_uri"]
     
-    # Clean up used state
-    await db.oauth_states.delete_one({"state": state})
-    
     config = get_linkedin_config()
     
-    async with httpx.AsyncClient() as client:
+    async with create_http_client("linkedin") as client:
         # Exchange code for access token
         token_url = "https://www.linkedin.com/oauth/v2/accessToken"
         token_data = {
@@ -542,6 +518,8 @@ async def linkedin_oauth_callback(
         token_data = response.json()
         access_token = token_data.get("access_token")
         expires_in = token_data.get("expires_in", 3600)
+        # Only issued to apps with programmatic refresh enabled
+        refresh_token = token_data.get("refresh_token")
         
         # Get user profile
         profile_url = "https://api.linkedin.com/v2/userinfo"
@@ -575,6 +553,7 @@ async def linkedin_oauth_callback(
             "username": profile_data.get("email"),
             "picture_url": profile_data.get("picture"),
             "access_token": access_token,
+            "refresh_token": refresh_token,
             "platform_account_id": user_sub,
             "urn": f"urn:li:person:{user_sub}",
             "is_active": True,
@@ -583,10 +562,13 @@ async def linkedin_oauth_callback(
             "token_expires_at": datetime.utcnow() + timedelta(seconds=expires_in)
         }
         
-        await db.social_accounts.update_one(
-            {"user_id": user_id, "platform": "linkedin", "platform_account_id": user_sub},
-            {"$set": personal_account},
-            upsert=True
+        await task_registry.run(
+            db.social_accounts.update_one(
+                {"user_id": user_id, "platform": "linkedin", "platform_account_id": user_sub},
+                {"$set": personal_account},
+                upsert=True
+            ),
+            name=f"oauth-sync:linkedin:{user_id}"
         )
         accounts_saved.append(user_name)
         
@@ -614,6 +596,7 @@ async def linkedin_oauth_callback(
                     "name": org_name,
                     "picture_url": logo_url,
                     "access_token": access_token,
+                    "refresh_token": refresh_token,
                     "platform_account_id": str(org_id),
                     "urn": f"urn:li:organization:{org_id}",
                     "is_active": True,
@@ -622,13 +605,18 @@ async def linkedin_oauth_callback(
                     "token_expires_at": datetime.utcnow() + timedelta(seconds=expires_in)
                 }
                 
-                await db.social_accounts.update_one(
-                    {"user_id": user_id, "platform": "linkedin", "platform_account_id": str(org_id)},
-                    {"$set": org_account},
-                    upsert=True
+                await task_registry.run(
+                    db.social_accounts.update_one(
+                        {"user_id": user_id, "platform": "linkedin", "platform_account_id": str(org_id)},
+                        {"$set": org_account},
+                        upsert=True
+                    ),
+                    name=f"oauth-sync:linkedin:{user_id}"
                 )
                 accounts_saved.append(org_name)
     
+    invalidate_connections(user_id)
+    
     # Return success page
     accounts_list = ", ".join(accounts_saved) if accounts_saved else "Aucun compte trouvé"
     success_html = f"""
@@ -670,17 +658,13 @@ async def linkedin_oauth_callback(
 @router.get("/linkedin/status")
 async def get_linkedin_connection_status(user_id: str = "default_user"):
     """Check if user has connected LinkedIn accounts"""
-    accounts = await db.social_accounts.find({
-        "user_id": user_id,
-        "platform": "linkedin",
-        "is_active": True
-    }).to_list(100)
-    
-    personal_accounts = [a for a in accounts if a.get("account_type") == "personal"]
-    company_accounts = [a for a in accounts if a.get("account_type") == "company"]
+    connections = await get_connections(db, user_id)
+    account_types = connections["platforms"]["linkedin"]["account_types"]
+    personal_accounts = account_types.get("personal", [])
+    company_accounts = account_types.get("company", [])
     
     return {
-        "connected": len(accounts) > 0,
+        "connected": connections["platforms"]["linkedin"]["connected"],
         "personal": {
             "connected": len(personal_accounts) > 0,
             "accounts": [{
@@ -709,6 +693,7 @@ async def disconnect_linkedin(user_id: str = "default_user"):
         {"user_id": user_id, "platform": "linkedin"},
         {"$set": {"is_active": False}}
     )
+    invalidate_connections(user_id)
     
     return {
         "success": True,
@@ -734,6 +719,7 @@ async def set_linkedin_default_account(
             {"user_id": user_id, "id": account_id},
             {"$set": {"is_default": True}}
         )
+    invalidate_connections(user_id)
     
     return {"success": True}
 
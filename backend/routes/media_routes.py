@@ -0,0 +1,49 @@
+"""Media routes (avatars, profile logos and their thumbnails)"""
+from fastapi import APIRouter, HTTPException, Header, Response
+from typing import Optional
+import re
+
+from services.media_store import open_image
+
+router = APIRouter(prefix="/media", tags=["Media"])
+
+# Database reference
+db = None
+
+def set_db(database):
+    global db
+    db = database
+
+
+# <sha256>[_<thumbnail size>]
+MEDIA_NAME_PATTERN = re.compile(r"^[0-9a-f]{64}(_\d+)?$")
+
+# Names are content hashes: a given URL never changes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@router.get("/{name}")
+async def get_media(name: str, if_none_match: Optional[str] = Header(None)):
+    """Serve a stored image"""
+    if not MEDIA_NAME_PATTERN.match(name):
+        raise HTTPException(status_code=404, detail="Média non trouvé")
+
+    etag = f'"{name}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "X-Content-Type-Options": "nosniff",
+    }
+
+    if if_none_match and etag in if_none_match:
+        return Response(status_code=304, headers=headers)
+
+    image = await open_image(db, name)
+    if not image:
+        raise HTTPException(status_code=404, detail="Média non trouvé")
+
+    data, content_type = image
+    if not content_type.startswith("image/"):
+        # Stored before the type was taken from the decoded image
+        content_type = "application/octet-stream"
+    return Response(content=data, media_type=content_type, headers=headers)
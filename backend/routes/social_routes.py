@@ -1,4 +1,5 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import ORJSONResponse
 from typing import List
 import os
 from datetime import datetime
@@ -9,29 +10,49 @@ from models.social_accounts import (
     ConnectAccountRequest,
     PublishRequest,
     PublishResponse,
-    SocialAccountResponse
+    SocialAccountResponse,
+    SocialPostResponse
 )
 from services.social_media import (
     FacebookPublisher,
     InstagramPublisher,
     LinkedInPublisher
 )
+from services.connections_service import invalidate_connections
+from services.http_client import create_http_client
+from services.fast_json import DocumentShape
+from services.etag import weak_etag, is_not_modified, not_modified, set_etag
+from services.task_registry import task_registry, ShuttingDown
 
 router = APIRouter(prefix="/social", tags=["Social Media"])
 
 # These will be injected from server.py
 db = None
 
+account_response_shape = DocumentShape(SocialAccountResponse)
+post_response_shape = DocumentShape(SocialPostResponse)
+
 def set_db(database):
     global db
     db = database
 
 
 @router.get("/accounts", response_model=List[SocialAccountResponse])
-async def get_connected_accounts(user_id: str = "default_user"):
+async def get_connected_accounts(request: Request, user_id: str = "default_user"):
     """Get all connected social media accounts for a user"""
-    accounts = await db.social_accounts.find({"user_id": user_id, "is_active": True}).to_list(100)
-    return [SocialAccountResponse(**acc) for acc in accounts]
+    accounts = await db.social_accounts.find(
+        {"user_id": user_id, "is_active": True},
+        account_response_shape.projection  # Public fields only, tokens stay in the database
+    ).to_list(100)
+    
+    # Accounts carry no version field: the public fields themselves are the version
+    etag = weak_etag(accounts)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    
+    response = ORJSONResponse(account_response_shape.prepare_all(accounts))
+    set_etag(response, etag)
+    return response
 
 
 @router.post("/connect")
@@ -47,7 +68,7 @@ async def connect_social_account(request: ConnectAccountRequest, user_id: str =
                 raise HTTPException(status_code=500, detail="Facebook credentials not configured")
             
             import httpx
-            async with httpx.AsyncClient() as client:
+            async with create_http_client("meta") as client:
                 token_url = f"https://graph.facebook.com/v20.0/oauth/access_token"
                 params = {
                     "client_id": app_id,
@@ -91,6 +112,7 @@ async def connect_social_account(request: ConnectAccountRequest, user_id: str =
                     upsert=True
                 )
                 stored_accounts.append(account_db)
+            invalidate_connections(user_id)
             
             return {
                 "success": True,
@@ -106,7 +128,7 @@ async def connect_social_account(request: ConnectAccountRequest, user_id: str =
                 raise HTTPException(status_code=500, detail="LinkedIn credentials not configured")
             
             import httpx
-            async with httpx.AsyncClient() as client:
+            async with create_http_client("linkedin") as client:
                 token_url = "https://www.linkedin.com/oauth/v2/accessToken"
                 data = {
                     "grant_type": "authorization_code",
@@ -151,6 +173,7 @@ async def connect_social_account(request: ConnectAccountRequest, user_id: str =
                     upsert=True
                 )
                 stored_accounts.append(account_db)
+            invalidate_connections(user_id)
             
             return {
                 "success": True,
@@ -167,9 +190,128 @@ async def connect_social_account(request: ConnectAccountRequest, user_id: str =
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _publish_to_account(account: dict, post_record: SocialPostDB, request: PublishRequest, progress: dict) -> dict:
+    """Publish one post and record the outcome; `progress` is what a checkpoint needs to resume it"""
+    account_id = account["id"]
+    await db.social_posts.insert_one(post_record.dict())
+    progress["stage"] = "publishing"
+    
+    try:
+        # Publish based on platform
+        if account["platform"] == "facebook":
+            publisher = FacebookPublisher(account["access_token"])
+            result = await publisher.publish_image(
+                account["platform_account_id"],
+                request.image_url,
+                request.caption
+            )
+            await publisher.close()
+        
+        elif account["platform"] == "instagram":
+            publisher = InstagramPublisher(account["access_token"])
+            result = await publisher.publish_image(
+                account["platform_account_id"],
+                request.image_url,
+                request.caption
+            )
+            await publisher.close()
+        
+        elif account["platform"] == "linkedin":
+            publisher = LinkedInPublisher(account["access_token"])
+            org_urn = account.get("urn") or f"urn:li:organization:{account['platform_account_id']}"
+            result = await publisher.publish_image(
+                org_urn,
+                request.image_url,
+                request.caption
+            )
+            await publisher.close()
+        
+        else:
+            result = None
+        
+        if result and result.success:
+            # Published on the platform: a resume must only record it, never post again
+            progress.update(stage="recording", platform_post_id=result.post_id, platform_post_url=result.post_url)
+            
+            # Update post record
+            await db.social_posts.update_one(
+                {"id": post_record.id},
+                {
+                    "$set": {
+                        "status": "published",
+                        "platform_post_id": result.post_id,
+                        "platform_post_url": result.post_url,
+                        "published_at": datetime.utcnow()
+                    }
+                }
+            )
+            
+            # Update account last used
+            await db.social_accounts.update_one(
+                {"user_id": account["user_id"], "id": account_id},
+                {"$set": {"last_used_at": datetime.utcnow()}}
+            )
+            
+            return {
+                "account_id": account_id,
+                "platform": account["platform"],
+                "account_name": account["name"],
+                "success": True,
+                "post_url": result.post_url
+            }
+        
+        error_msg = result.error_message if result else "Unknown error"
+        await db.social_posts.update_one(
+            {"id": post_record.id},
+            {
+                "$set": {
+                    "status": "failed",
+                    "error_message": error_msg
+                }
+            }
+        )
+        return {
+            "account_id": account_id,
+            "platform": account["platform"],
+            "account_name": account["name"],
+            "success": False,
+            "error": error_msg
+        }
+    
+    except Exception as e:
+        await db.social_posts.update_one(
+            {"id": post_record.id},
+            {
+                "$set": {
+                    "status": "failed",
+                    "error_message": str(e)
+                }
+            }
+        )
+        return {
+            "account_id": account_id,
+            "platform": account["platform"],
+            "success": False,
+            "error": str(e)
+        }
+
+
+def _publish_checkpoint(post_id: str, progress: dict):
+    """Put a post cut off by shutdown back to pending, with the state needed to resume it"""
+    async def checkpoint():
+        await db.social_posts.update_one(
+            {"id": post_id, "status": "pending"},
+            {"$set": {"interrupted_at": datetime.utcnow(), "resume_state": dict(progress)}}
+        )
+    return checkpoint
+
+
 @router.post("/publish", response_model=PublishResponse)
 async def publish_to_social_media(request: PublishRequest, user_id: str = "default_user"):
     """Publish content to selected social media accounts"""
+    if not task_registry.accepting:
+        raise HTTPException(status_code=503, detail="Server is shutting down")
+    
     results = []
     success_count = 0
     fail_count = 0
@@ -201,105 +343,27 @@ async def publish_to_social_media(request: PublishRequest, user_id: str = "defau
             image_url=request.image_url,
             status="pending"
         )
-        await db.social_posts.insert_one(post_record.dict())
         
+        # Tracked task: finishes (or is checkpointed) even if this request is cancelled
+        progress = {"stage": "queued"}
         try:
-            # Publish based on platform
-            if account["platform"] == "facebook":
-                publisher = FacebookPublisher(account["access_token"])
-                result = await publisher.publish_image(
-                    account["platform_account_id"],
-                    request.image_url,
-                    request.caption
-                )
-                await publisher.close()
-            
-            elif account["platform"] == "instagram":
-                publisher = InstagramPublisher(account["access_token"])
-                result = await publisher.publish_image(
-                    account["platform_account_id"],
-                    request.image_url,
-                    request.caption
-                )
-                await publisher.close()
-            
-            elif account["platform"] == "linkedin":
-                publisher = LinkedInPublisher(account["access_token"])
-                org_urn = account.get("urn") or f"urn:li:organization:{account['platform_account_id']}"
-                result = await publisher.publish_image(
-                    org_urn,
-                    request.image_url,
-                    request.caption
-                )
-                await publisher.close()
-            
-            else:
-                result = None
-            
-            if result and result.success:
-                # Update post record
-                await db.social_posts.update_one(
-                    {"id": post_record.id},
-                    {
-                        "$set": {
-                            "status": "published",
-                            "platform_post_id": result.post_id,
-                            "platform_post_url": result.post_url,
-                            "published_at": datetime.utcnow()
-                        }
-                    }
-                )
-                
-                # Update account last used
-                await db.social_accounts.update_one(
-                    {"id": account_id},
-                    {"$set": {"last_used_at": datetime.utcnow()}}
-                )
-                
-                results.append({
-                    "account_id": account_id,
-                    "platform": account["platform"],
-                    "account_name": account["name"],
-                    "success": True,
-                    "post_url": result.post_url
-                })
-                success_count += 1
-            else:
-                error_msg = result.error_message if result else "Unknown error"
-                await db.social_posts.update_one(
-                    {"id": post_record.id},
-                    {
-                        "$set": {
-                            "status": "failed",
-                            "error_message": error_msg
-                        }
-                    }
-                )
-                results.append({
-                    "account_id": account_id,
-                    "platform": account["platform"],
-                    "account_name": account["name"],
-                    "success": False,
-                    "error": error_msg
-                })
-                fail_count += 1
-        
-        except Exception as e:
-            await db.social_posts.update_one(
-                {"id": post_record.id},
-                {
-                    "$set": {
-                        "status": "failed",
-                        "error_message": str(e)
-                    }
-                }
+            result = await task_registry.run(
+                _publish_to_account(account, post_record, request, progress),
+                name=f"publish:{post_record.id}",
+                checkpoint=_publish_checkpoint(post_record.id, progress)
             )
-            results.append({
+        except ShuttingDown:
+            result = {
                 "account_id": account_id,
                 "platform": account["platform"],
                 "success": False,
-                "error": str(e)
-            })
+                "error": "Server is shutting down"
+            }
+        
+        results.append(result)
+        if result["success"]:
+            success_count += 1
+        else:
             fail_count += 1
     
     return PublishResponse(
@@ -320,18 +384,20 @@ async def disconnect_account(account_id: str, user_id: str = "default_user"):
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Account not found")
     
+    invalidate_connections(user_id)
+    
     return {"success": True, "message": "Account disconnected"}
 
 
-@router.get("/posts")
+@router.get("/posts", response_model=List[SocialPostResponse])
 async def get_publish_history(user_id: str = "default_user", limit: int = 50):
     """Get publishing history for a user"""
     posts = await db.social_posts.find(
         {"user_id": user_id},
-        {"_id": 0}  # Exclude MongoDB _id field
+        post_response_shape.projection  # Response fields only (no resume state)
     ).sort("created_at", -1).limit(limit).to_list(limit)
     
-    return posts
+    return ORJSONResponse(post_response_shape.prepare_all(posts))
 
 
 @router.get("/insights/summary")
@@ -403,7 +469,7 @@ async def get_post_insights(post_id: str, user_id: str = "default_user"):
     insights = {"platform": platform, "post_id": platform_post_id}
     
     try:
-        async with httpx.AsyncClient() as client:
+        async with create_http_client() as client:
             if platform == "facebook":
                 # Get Facebook post insights
                 url = f"https://graph.facebook.com/v20.0/{platform_post_id}"
@@ -1,17 +1,29 @@
 """User authentication and profile routes"""
-from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, Response
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from typing import Optional
+from contextlib import contextmanager
 from datetime import datetime
+import calendar
+import ipaddress
+import os
 
 from models.user import (
     UserCreate, UserLogin, UserUpdate, UserInDB, UserResponse,
     TokenResponse, RefreshTokenRequest, PasswordChangeRequest,
     ProfileUpdateRequest, ThemesUpdateRequest, OnboardingCompleteRequest,
-    UserProfile, ProfileType
+    UserProfile, ProfileType, UserPrincipal, UserRole
 )
 from services.auth_service import (
-    get_password_hash, verify_password, create_tokens,
-    verify_access_token, verify_refresh_token
+    create_tokens, verify_access_token, verify_refresh_token
+)
+from services.password_service import password_hasher
+from services.cache import TTLCache
+from services.rate_limiter import SlidingWindowLimiter
+from services.etag import weak_etag, is_not_modified, not_modified, set_etag
+from services.media_store import (
+    InvalidImageError, is_inline_image, store_image, offload_profile_logos, migrate_user_images
 )
 
 router = APIRouter(prefix="/users", tags=["Users"])
@@ -24,6 +36,151 @@ def set_db(database):
     db = database
 
 
+# Refresh-token revocation store (set from server.py)
+revocation_store = None
+
+def set_revocation_store(store):
+    global revocation_store
+    revocation_store = store
+
+
+# Authenticated principals, keyed by user id
+principal_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+)
+
+# Login attempts, checked before any bcrypt work
+LOGIN_RATE_WINDOW_SECONDS = float(os.getenv("LOGIN_RATE_WINDOW_SECONDS", "300"))
+login_email_limiter = SlidingWindowLimiter(
+    limit=int(os.getenv("LOGIN_RATE_LIMIT_PER_EMAIL", "10")),
+    window=LOGIN_RATE_WINDOW_SECONDS
+)
+login_ip_limiter = SlidingWindowLimiter(
+    limit=int(os.getenv("LOGIN_RATE_LIMIT_PER_IP", "50")),
+    window=LOGIN_RATE_WINDOW_SECONDS
+)
+
+# Reverse proxies in front of the API (the ingress), each appending to
+# X-Forwarded-For. The header is only read when the peer is one of them, i.e.
+# within TRUSTED_PROXY_CIDRS (private and loopback ranges by default);
+# TRUSTED_PROXY_HOPS=0 ignores it altogether.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+TRUSTED_PROXY_NETWORKS = [
+    ipaddress.ip_network(cidr.strip())
+    for cidr in os.getenv(
+        "TRUSTED_PROXY_CIDRS", "10.0.0.0/8,172.16.0.0/12,192.168.0.0/16,127.0.0.0/8,::1/128,fc00::/7"
+    ).split(",")
+    if cidr.strip()
+]
+
+# Only the fields needed for authorization (no avatar / profile logos),
+# plus the timestamps versioning the profile for conditional GETs
+PRINCIPAL_PROJECTION = {
+    "_id": 0, "id": 1, "email": 1, "role": 1, "is_active": 1,
+    "oauth_providers": 1, "updated_at": 1, "last_login": 1
+}
+
+# Everything but the password hash, for full user responses
+USER_RESPONSE_PROJECTION = {"_id": 0, "hashed_password": 0}
+
+
+def invalidate_user(user_id: str):
+    """Evict a cached principal after the user document changed"""
+    principal_cache.delete(user_id)
+
+
+def issued_before_cutoff(payload: dict, user_doc: dict) -> bool:
+    """True if the token predates the user's `tokens_valid_after` (password change, deletion)"""
+    cutoff = user_doc.get("tokens_valid_after")
+    if not cutoff:
+        return False
+    # iat has a one-second resolution
+    return payload.get("iat", 0) < int(calendar.timegm(cutoff.utctimetuple()))
+
+
+def is_trusted_proxy(host: Optional[str]) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXY_NETWORKS)
+
+
+def client_ip(request: Request) -> str:
+    """Client address, as seen by the outermost trusted proxy
+
+    Only the right-most `TRUSTED_PROXY_HOPS` X-Forwarded-For entries were
+    written by our proxies; anything left of them is client-controlled. A
+    peer outside the trusted networks is the client itself.
+    """
+    peer = request.client.host if request.client else None
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if TRUSTED_PROXY_HOPS and forwarded_for and is_trusted_proxy(peer):
+        hops = [hop.strip() for hop in forwarded_for.split(",")]
+        return hops[max(len(hops) - TRUSTED_PROXY_HOPS, 0)]
+    return peer or "unknown"
+
+
+def check_login_allowed(email: str, ip: str):
+    """Reject login attempts over the per-email / per-IP limits"""
+    for limiter, key in ((login_ip_limiter, ip), (login_email_limiter, email)):
+        if not limiter.hit(key):
+            raise HTTPException(
+                status_code=429,
+                detail="Trop de tentatives de connexion, réessayez plus tard",
+                headers={"Retry-After": str(limiter.retry_after(key))}
+            )
+
+
+@contextmanager
+def hash_capacity():
+    """Hold a password hashing slot, shedding load when none is left"""
+    if not password_hasher.try_reserve():
+        raise HTTPException(
+            status_code=429,
+            detail="Service surchargé, réessayez dans quelques instants",
+            headers={"Retry-After": "1"}
+        )
+    try:
+        yield
+    finally:
+        password_hasher.release()
+
+
+async def store_profile_logos(profiles: list):
+    """Move uploaded (base64) profile logos to the media store"""
+    try:
+        await offload_profile_logos(db, profiles)
+    except InvalidImageError:
+        raise HTTPException(status_code=400, detail="Logo invalide")
+
+
+# ============================================================
+# USER REPOSITORY
+# ============================================================
+
+async def insert_user(user: UserInDB):
+    """Insert a new user document"""
+    await db.users.insert_one(user.model_dump())
+
+
+async def update_user(
+    user_id: str,
+    update: dict,
+    projection: Optional[dict] = USER_RESPONSE_PROJECTION
+) -> Optional[dict]:
+    """Apply `update` and return the updated document in a single round trip"""
+    updated_doc = await db.users.find_one_and_update(
+        {"id": user_id},
+        update,
+        projection=projection,
+        return_document=ReturnDocument.AFTER
+    )
+    invalidate_user(user_id)
+    return updated_doc
+
+
 # Default profiles for new users
 DEFAULT_PROFILES = [
     UserProfile(type=ProfileType.EQUIPE, name="Une Équipe", id="base_equipe"),
@@ -34,7 +191,7 @@ DEFAULT_PROFILES = [
 ]
 
 
-async def get_current_user(authorization: Optional[str] = Header(None)) -> UserInDB:
+async def get_current_user(authorization: Optional[str] = Header(None)) -> UserPrincipal:
     """Dependency to get current authenticated user"""
     if not authorization:
         raise HTTPException(status_code=401, detail="Token d'authentification requis")
@@ -51,15 +208,28 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> UserI
         raise HTTPException(status_code=401, detail="Token invalide ou expiré")
     
     user_id = payload.get("sub")
-    user_doc = await db.users.find_one({"id": user_id})
-    
-    if not user_doc:
-        raise HTTPException(status_code=401, detail="Utilisateur non trouvé")
-    
-    if not user_doc.get("is_active", True):
+    principal = principal_cache.get(user_id)
+    
+    if principal is None:
+        user_doc = await db.users.find_one({"id": user_id}, PRINCIPAL_PROJECTION)
+        
+        if not user_doc:
+            raise HTTPException(status_code=401, detail="Utilisateur non trouvé")
+        
+        principal = UserPrincipal(**user_doc)
+        principal_cache.set(user_id, principal)
+    
+    if not principal.is_active:
         raise HTTPException(status_code=401, detail="Compte désactivé")
     
-    return UserInDB(**user_doc)
+    return principal
+
+
+async def get_current_admin(current_user: UserPrincipal = Depends(get_current_user)) -> UserPrincipal:
+    """Dependency restricting a route to admins"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Accès réservé aux administrateurs")
+    return current_user
 
 
 @router.post("/register", response_model=TokenResponse)
@@ -92,26 +262,27 @@ async def register(user_data: UserCreate):
     if existing:
         raise HTTPException(status_code=400, detail="Cet email est déjà utilisé")
     
+    with hash_capacity():
+        hashed_password = await password_hasher.hash(user_data.password)
+    
     # Create user
     user = UserInDB(
         email=email,
         name=name,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=hashed_password,
         profiles=[p.model_dump() for p in DEFAULT_PROFILES],
+        last_login=datetime.utcnow(),
     )
     
-    # Save to database
-    await db.users.insert_one(user.model_dump())
+    # Save to database (the unique email index settles concurrent sign-ups)
+    try:
+        await insert_user(user)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Cet email est déjà utilisé")
     
     # Create tokens
     access_token, refresh_token, expires_in = create_tokens(user.id, user.email)
     
-    # Update last login
-    await db.users.update_one(
-        {"id": user.id},
-        {"$set": {"last_login": datetime.utcnow()}}
-    )
-    
     return TokenResponse(
         access_token=access_token,
         refresh_token=refresh_token,
@@ -121,31 +292,48 @@ async def register(user_data: UserCreate):
 
 
 @router.post("/login", response_model=TokenResponse)
-async def login(credentials: UserLogin):
+async def login(credentials: UserLogin, request: Request):
     """Login with email and password"""
+    email = credentials.email.lower()
+    check_login_allowed(email, client_ip(request))
+    
     # Find user
-    user_doc = await db.users.find_one({"email": credentials.email.lower()})
+    user_doc = await db.users.find_one({"email": email})
     
     if not user_doc:
         raise HTTPException(status_code=401, detail="Email ou mot de passe incorrect")
     
     user = UserInDB(**user_doc)
     
-    # Verify password
-    if not verify_password(credentials.password, user.hashed_password):
+    # Verify password (rehashed when the work factor changed)
+    with hash_capacity():
+        is_valid, new_hash = await password_hasher.verify_and_update(
+            credentials.password, user.hashed_password
+        )
+    if not is_valid:
         raise HTTPException(status_code=401, detail="Email ou mot de passe incorrect")
     
+    # A successful login clears the per-email window (the per-IP one keeps counting)
+    login_email_limiter.reset(email)
+    
     if not user.is_active:
         raise HTTPException(status_code=401, detail="Compte désactivé")
     
+    # Documents written before the media store may still hold inline images
+    user = UserInDB(**await migrate_user_images(db, user_doc))
+    
     # Create tokens
     access_token, refresh_token, expires_in = create_tokens(user.id, user.email)
     
     # Update last login
+    login_update = {"last_login": datetime.utcnow()}
+    if new_hash:
+        login_update["hashed_password"] = new_hash
     await db.users.update_one(
         {"id": user.id},
-        {"$set": {"last_login": datetime.utcnow()}}
+        {"$set": login_update}
     )
+    invalidate_user(user.id)
     
     return TokenResponse(
         access_token=access_token,
@@ -163,17 +351,32 @@ async def refresh_token(request: RefreshTokenRequest):
     if not payload:
         raise HTTPException(status_code=401, detail="Refresh token invalide ou expiré")
     
+    # Tokens issued before rotation was introduced carry no jti
+    jti = payload.get("jti")
+    if jti and await revocation_store.is_revoked(jti):
+        raise HTTPException(status_code=401, detail="Refresh token révoqué")
+    
     user_id = payload.get("sub")
     user_doc = await db.users.find_one({"id": user_id})
     
     if not user_doc:
         raise HTTPException(status_code=401, detail="Utilisateur non trouvé")
     
+    user_doc = await migrate_user_images(db, user_doc)
     user = UserInDB(**user_doc)
     
     if not user.is_active:
         raise HTTPException(status_code=401, detail="Compte désactivé")
     
+    if issued_before_cutoff(payload, user_doc):
+        raise HTTPException(status_code=401, detail="Refresh token révoqué")
+    
+    # Rotate: the presented refresh token can only be used once
+    if jti and not await revocation_store.revoke(
+        jti, user_id, datetime.utcfromtimestamp(payload["exp"])
+    ):
+        raise HTTPException(status_code=401, detail="Refresh token révoqué")
+    
     # Create new tokens
     access_token, new_refresh_token, expires_in = create_tokens(user.id, user.email)
     
@@ -185,62 +388,122 @@ async def refresh_token(request: RefreshTokenRequest):
     )
 
 
+@router.post("/logout")
+async def logout(request: RefreshTokenRequest):
+    """Revoke a refresh token"""
+    payload = verify_refresh_token(request.refresh_token)
+    
+    if payload and payload.get("jti"):
+        await revocation_store.revoke(
+            payload["jti"], payload.get("sub"), datetime.utcfromtimestamp(payload["exp"])
+        )
+    
+    return {"message": "Déconnexion réussie"}
+
+
 @router.get("/me", response_model=UserResponse)
-async def get_me(current_user: UserInDB = Depends(get_current_user)):
+async def get_me(
+    request: Request,
+    response: Response,
+    current_user: UserPrincipal = Depends(get_current_user)
+):
     """Get current user profile"""
-    return UserResponse(**current_user.model_dump())
+    # Every profile change bumps updated_at (and evicts the cached principal)
+    etag = weak_etag(current_user.id, current_user.updated_at, current_user.last_login)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    
+    user_doc = await db.users.find_one({"id": current_user.id}, USER_RESPONSE_PROJECTION)
+    
+    if not user_doc:
+        raise HTTPException(status_code=401, detail="Utilisateur non trouvé")
+    
+    set_etag(response, etag)
+    return UserResponse(**await migrate_user_images(db, user_doc))
 
 
 @router.put("/me", response_model=UserResponse)
 async def update_me(
     update_data: UserUpdate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Update current user profile"""
     update_dict = {k: v for k, v in update_data.model_dump().items() if v is not None}
     update_dict["updated_at"] = datetime.utcnow()
     
-    await db.users.update_one(
-        {"id": current_user.id},
+    # Only the avatar URL is kept in the user document
+    if is_inline_image(update_dict.get("avatar")):
+        try:
+            stored = await store_image(db, update_dict["avatar"])
+        except InvalidImageError:
+            raise HTTPException(status_code=400, detail="Avatar invalide")
+        update_dict["avatar"] = stored["url"]
+        update_dict["avatar_thumbnails"] = stored["thumbnails"]
+    
+    updated_doc = await update_user(
+        current_user.id,
         {"$set": update_dict}
     )
     
-    updated_doc = await db.users.find_one({"id": current_user.id})
+    if not updated_doc:
+        raise HTTPException(status_code=401, detail="Utilisateur non trouvé")
+    
     return UserResponse(**updated_doc)
 
 
 @router.post("/me/change-password")
 async def change_password(
     request: PasswordChangeRequest,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Change user password"""
-    if not verify_password(request.current_password, current_user.hashed_password):
-        raise HTTPException(status_code=400, detail="Mot de passe actuel incorrect")
+    user_doc = await db.users.find_one({"id": current_user.id}, {"_id": 0, "hashed_password": 1})
     
-    new_hash = get_password_hash(request.new_password)
+    # The principal may come from the cache after the user was deleted
+    if not user_doc:
+        raise HTTPException(status_code=401, detail="Utilisateur non trouvé")
     
+    with hash_capacity():
+        if not await password_hasher.verify(request.current_password, user_doc["hashed_password"]):
+            raise HTTPException(status_code=400, detail="Mot de passe actuel incorrect")
+        
+        new_hash = await password_hasher.hash(request.new_password)
+    now = datetime.utcnow()
+    
+    # Revokes every refresh token issued before the change
     await db.users.update_one(
         {"id": current_user.id},
         {"$set": {
             "hashed_password": new_hash,
-            "updated_at": datetime.utcnow()
+            "tokens_valid_after": now,
+            "updated_at": now
         }}
     )
+    invalidate_user(current_user.id)
     
-    return {"message": "Mot de passe modifié avec succès"}
+    # Fresh tokens so the current session survives the revocation
+    access_token, refresh_token, expires_in = create_tokens(current_user.id, current_user.email)
+    
+    return {
+        "message": "Mot de passe modifié avec succès",
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_in": expires_in
+    }
 
 
 @router.put("/me/profiles", response_model=UserResponse)
 async def update_profiles(
     request: ProfileUpdateRequest,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Update user profiles"""
     profiles_dict = [p.model_dump() for p in request.profiles]
+    await store_profile_logos(profiles_dict)
     
-    await db.users.update_one(
-        {"id": current_user.id},
+    updated_doc = await update_user(
+        current_user.id,
         {"$set": {
             "profiles": profiles_dict,
             "active_profile_index": request.active_profile_index,
@@ -248,38 +511,43 @@ async def update_profiles(
         }}
     )
     
-    updated_doc = await db.users.find_one({"id": current_user.id})
+    if not updated_doc:
+        raise HTTPException(status_code=401, detail="Utilisateur non trouvé")
+    
     return UserResponse(**updated_doc)
 
 
 @router.put("/me/themes", response_model=UserResponse)
 async def update_themes(
     request: ThemesUpdateRequest,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Update selected themes"""
-    await db.users.update_one(
-        {"id": current_user.id},
+    updated_doc = await update_user(
+        current_user.id,
         {"$set": {
             "selected_themes": request.themes,
             "updated_at": datetime.utcnow()
         }}
     )
     
-    updated_doc = await db.users.find_one({"id": current_user.id})
+    if not updated_doc:
+        raise HTTPException(status_code=401, detail="Utilisateur non trouvé")
+    
     return UserResponse(**updated_doc)
 
 
 @router.post("/me/complete-onboarding", response_model=UserResponse)
 async def complete_onboarding(
     request: OnboardingCompleteRequest,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Complete onboarding with profiles and themes"""
     profiles_dict = [p.model_dump() for p in request.profiles]
+    await store_profile_logos(profiles_dict)
     
-    await db.users.update_one(
-        {"id": current_user.id},
+    updated_doc = await update_user(
+        current_user.id,
         {"$set": {
             "profiles": profiles_dict,
             "selected_themes": request.themes,
@@ -288,20 +556,25 @@ async def complete_onboarding(
         }}
     )
     
-    updated_doc = await db.users.find_one({"id": current_user.id})
+    if not updated_doc:
+        raise HTTPException(status_code=401, detail="Utilisateur non trouvé")
+    
     return UserResponse(**updated_doc)
 
 
 @router.delete("/me")
-async def delete_account(current_user: UserInDB = Depends(get_current_user)):
+async def delete_account(current_user: UserPrincipal = Depends(get_current_user)):
     """Delete user account (soft delete)"""
+    now = datetime.utcnow()
     await db.users.update_one(
         {"id": current_user.id},
         {"$set": {
             "is_active": False,
-            "updated_at": datetime.utcnow()
+            "tokens_valid_after": now,
+            "updated_at": now
         }}
     )
+    invalidate_user(current_user.id)
     
     return {"message": "Compte supprimé avec succès"}
 
@@ -311,7 +584,7 @@ async def delete_account(current_user: UserInDB = Depends(get_current_user)):
 async def link_oauth_provider(
     provider: str,
     provider_user_id: str,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Link an OAuth provider to current user"""
     if provider not in ["meta", "linkedin", "google"]:
@@ -328,6 +601,7 @@ async def link_oauth_provider(
             "$set": {"updated_at": datetime.utcnow()}
         }
     )
+    invalidate_user(current_user.id)
     
     return {"message": f"{provider} lié avec succès"}
 
@@ -335,14 +609,20 @@ async def link_oauth_provider(
 @router.delete("/me/unlink-oauth/{provider}")
 async def unlink_oauth_provider(
     provider: str,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Unlink an OAuth provider from current user"""
     if provider not in current_user.oauth_providers:
         raise HTTPException(status_code=400, detail="Provider non lié")
     
     # Ensure user has a password before unlinking
-    if not current_user.hashed_password and len(current_user.oauth_providers) <= 1:
+    if len(current_user.oauth_providers) <= 1:
+        user_doc = await db.users.find_one({"id": current_user.id}, {"_id": 0, "hashed_password": 1})
+        has_password = bool(user_doc and user_doc.get("hashed_password"))
+    else:
+        has_password = True
+    
+    if not has_password:
         raise HTTPException(
             status_code=400, 
             detail="Impossible de supprimer le dernier mode de connexion. Définissez d'abord un mot de passe."
@@ -355,5 +635,6 @@ async def unlink_oauth_provider(
             "$set": {"updated_at": datetime.utcnow()}
         }
     )
+    invalidate_user(current_user.id)
     
     return {"message": f"{provider} délié avec succès"}
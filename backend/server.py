@@ -1,20 +1,40 @@
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Response, Query, HTTPException, Depends, Header
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
+from contextlib import asynccontextmanager
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
 import uuid
 from datetime import datetime
+import orjson
 
 # Import routes
 from routes import social_routes
 from routes import auth_routes
 from routes import atc_routes
 from routes import users_routes
+from routes import media_routes
+from services import db_indexes
+from services.fast_json import DocumentShape
+from services.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_filter
+from services import mongo_monitoring
+from services import metrics
+from services.structured_logging import setup_logging
+from middleware.metrics import MetricsMiddleware
+from middleware.compression import CompressionMiddleware
+from middleware.request_id import RequestIdMiddleware
+from middleware.profiling import ProfilingMiddleware, profiling_enabled
+from services.mongo_client import create_client
+from services import token_refresh_service
+from services import token_revocation_service
+from services.password_service import password_hasher
+from services.task_registry import task_registry
+from services.cache_bus import CacheInvalidationBus
+from services.connections_service import connections_cache
 
 
 ROOT_DIR = Path(__file__).parent
@@ -22,19 +42,50 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
+# Pool size, timeouts, compressors and concerns come from MONGO_* variables
+client = create_client(mongo_url)
 # DB_NAME is provided by Kubernetes in production, fallback to test_database for local dev
 db_name = os.environ.get('DB_NAME', 'test_database')
 db = client[db_name]
 
+# Background jobs
+token_refresh_scheduler = token_refresh_service.TokenRefreshScheduler(db)
+token_revocation_store = token_revocation_service.TokenRevocationStore(db)
+
+# Evict every worker's in-process caches when the documents behind them change
+cache_bus = CacheInvalidationBus(db)
+cache_bus.subscribe("users", users_routes.principal_cache, key_field="id")
+cache_bus.subscribe("social_accounts", connections_cache, key_field="user_id")
+cache_bus.subscribe("atc_price_config", atc_routes.price_config_cache)
+cache_bus.subscribe("atc_promos", atc_routes.promo_cache)
+
 # Initialize routes with database
 social_routes.set_db(db)
 auth_routes.set_db(db)
 atc_routes.set_db(db)
 users_routes.set_db(db)
+media_routes.set_db(db)
+users_routes.set_revocation_store(token_revocation_store)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await db_indexes.ensure_indexes(db)
+    await token_refresh_scheduler.start()
+    await token_revocation_store.start()
+    await cache_bus.start()
+    yield
+    # Stop taking new publishes, let in-flight ones finish (or checkpoint them), then close pools
+    drain_seconds = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "20"))
+    await task_registry.drain(drain_seconds)
+    await token_refresh_scheduler.stop(timeout=drain_seconds)
+    await token_revocation_store.stop()
+    await cache_bus.stop()
+    password_hasher.shutdown()
+    client.close()
+    log_listener.stop()
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -49,6 +100,20 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+status_check_shape = DocumentShape(StatusCheck)
+
+# Newest first, ties broken by id (index registered in services/db_indexes.py)
+STATUS_CHECK_ORDER = [("timestamp", -1), ("id", -1)]
+STATUS_STREAM_BATCH_SIZE = int(os.getenv("STATUS_STREAM_BATCH_SIZE", "500"))
+
+def status_checks_query(cursor: Optional[str]) -> dict:
+    if not cursor:
+        return {}
+    try:
+        return keyset_filter(*decode_cursor(cursor))
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
@@ -62,13 +127,41 @@ async def create_status_check(input: StatusCheckCreate):
     return status_obj
 
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    # Optimized query with projection and limit
+async def get_status_checks(
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None
+):
+    # One page after `cursor`; X-Next-Cursor continues from the last row when there are more
     status_checks = await db.status_checks.find(
-        {}, 
-        {"_id": 0, "id": 1, "client_name": 1, "timestamp": 1}
-    ).limit(1000).to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+        status_checks_query(cursor), 
+        status_check_shape.projection
+    ).sort(STATUS_CHECK_ORDER).limit(limit + 1).to_list(limit + 1)
+    
+    response = ORJSONResponse(status_check_shape.prepare_all(status_checks[:limit]))
+    if len(status_checks) > limit:
+        last = status_checks[limit - 1]
+        # Legacy documents may lack a timestamp (they sort last)
+        response.headers["X-Next-Cursor"] = encode_cursor(last.get("timestamp"), last["id"])
+    return response
+
+@api_router.get("/status/stream")
+async def stream_status_checks(cursor: Optional[str] = None):
+    # NDJSON, read batch by batch from the Motor cursor: memory stays flat whatever the count
+    query = status_checks_query(cursor)
+    
+    async def lines():
+        documents = db.status_checks.find(query, status_check_shape.projection) \
+            .sort(STATUS_CHECK_ORDER).batch_size(STATUS_STREAM_BATCH_SIZE)
+        async for document in documents:
+            yield orjson.dumps(status_check_shape.prepare(document)) + b"\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@api_router.get("/health/db", dependencies=[Depends(users_routes.get_current_admin)])
+async def db_health():
+    # Per-command latency and connection pool usage since startup (admins only:
+    # it exposes server addresses and command names)
+    return mongo_monitoring.snapshot()
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -85,21 +178,39 @@ app.include_router(atc_routes.router, prefix="/api")
 # Include users routes (authentication)
 app.include_router(users_routes.router, prefix="/api")
 
+# Include media routes (avatars, logos)
+app.include_router(media_routes.router, prefix="/api")
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+# Brotli / gzip for JSON and HTML bodies above COMPRESSION_MIN_SIZE
+app.add_middleware(CompressionMiddleware)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+# Opt-in per-request profiling (admins only), not installed unless enabled
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+
+# Outside everything else, so the recorded latency covers every other middleware
+app.add_middleware(MetricsMiddleware)
+
+# Request id for the logs of the whole request (and X-Request-ID on the response)
+app.add_middleware(RequestIdMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    # Collection, command and route names are internals: scraper token only
+    if not metrics.scrape_allowed(authorization):
+        raise HTTPException(status_code=404, detail="Not Found")
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
+
+# Configure logging: JSON records, written off the event loop by a listener thread
+log_listener = setup_logging()
+logger = logging.getLogger(__name__)
@@ -1,17 +1,24 @@
 """Authentication service for Artywiz"""
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
+import hashlib
 import os
 import secrets
+import time
+import uuid
 from passlib.context import CryptContext
 from jose import JWTError, jwt
+import jwt as pyjwt
 from dotenv import load_dotenv
 from pathlib import Path
 
+from services.cache import TTLCache
+
 load_dotenv(Path(__file__).parent.parent / '.env')
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing (work factor configurable, existing hashes are upgraded on login)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 # JWT Configuration
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", secrets.token_urlsafe(32))
@@ -19,6 +26,15 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
+# JWT verification backend: "jose" (default) or "pyjwt" (see benchmarks/bench_jwt.py)
+JWT_BACKEND = os.getenv("JWT_BACKEND", "jose").lower()
+
+# Verified claims keyed by token digest, each entry expiring at the token's `exp`
+decoded_token_cache = TTLCache(
+    maxsize=int(os.getenv("JWT_CACHE_SIZE", "10000")),
+    ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60
+)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
@@ -33,16 +49,18 @@ def get_password_hash(password: str) -> str:
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire, "type": "access"})
+    now = datetime.utcnow()
+    expire = now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    to_encode.update({"exp": expire, "iat": now, "type": "access"})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
 def create_refresh_token(data: dict) -> str:
-    """Create a JWT refresh token"""
+    """Create a JWT refresh token (with a unique jti, so it can be revoked)"""
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire, "type": "refresh"})
+    now = datetime.utcnow()
+    expire = now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    to_encode.update({"exp": expire, "iat": now, "jti": uuid.uuid4().hex, "type": "refresh"})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
@@ -54,15 +72,36 @@ def create_tokens(user_id: str, email: str) -> Tuple[str, str, int]:
     return access_token, refresh_token, ACCESS_TOKEN_EXPIRE_MINUTES * 60
 
 
-def decode_token(token: str) -> Optional[dict]:
-    """Decode and validate a JWT token"""
+def _decode_jwt(token: str, backend: str = JWT_BACKEND) -> Optional[dict]:
+    """Fully verify a JWT (signature and expiry) with the selected backend"""
+    if backend == "pyjwt":
+        try:
+            return pyjwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except pyjwt.PyJWTError:
+            return None
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
         return None
 
 
+def decode_token(token: str) -> Optional[dict]:
+    """Decode and validate a JWT token"""
+    key = hashlib.sha256(token.encode()).digest()
+    payload = decoded_token_cache.get(key)
+    
+    if payload is None:
+        payload = _decode_jwt(token)
+        if payload is None:
+            return None
+        ttl = payload.get("exp", 0) - time.time()
+        if ttl > 0:
+            decoded_token_cache.set(key, payload, ttl=ttl)
+    
+    # Callers get their own copy of the cached claims
+    return dict(payload)
+
+
 def verify_access_token(token: str) -> Optional[dict]:
     """Verify an access token and return payload"""
     payload = decode_token(token)
@@ -0,0 +1,124 @@
+"""Cross-worker cache invalidation over MongoDB change streams
+
+Every worker keeps in-process caches (principals, connections, price
+config, promos). Local writes evict their own entries, but other workers,
+and writes made outside the API, would otherwise be seen only when entries
+expire. The bus watches the collections behind those caches and evicts the
+affected key as documents change:
+
+    cache_bus.subscribe("users", principal_cache, key_field="id")
+    cache_bus.subscribe("atc_price_config", price_config_cache)  # no key: clear
+
+Deletes (no document to read the key from), updates or replaces that may
+have changed the key itself (the previous key is not in the event),
+invalidations and any gap in the stream (reconnect, lost resume token) clear
+the whole cache. Change
+streams need a replica set: on a standalone server the bus logs a warning
+and stops, and caches fall back to their TTL.
+
+- CACHE_BUS_ENABLED (default true)
+- CACHE_BUS_RETRY_SECONDS: delay before reopening a failed stream (default 5)
+"""
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# "The $changeStream stage is only supported on replica sets"
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+
+class CacheInvalidationBus:
+    """One change stream per subscribed collection, evicting cache keys"""
+
+    def __init__(self, db, retry_seconds: Optional[float] = None):
+        self.db = db
+        self.retry_seconds = retry_seconds if retry_seconds is not None else float(os.getenv("CACHE_BUS_RETRY_SECONDS", "5"))
+        self._subscriptions: Dict[str, List[Tuple[TTLCache, Optional[str]]]] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._ready: List[asyncio.Event] = []
+
+    def subscribe(self, collection: str, cache: TTLCache, key_field: Optional[str] = None):
+        """Evict `cache[document[key_field]]` on changes to `collection` (the whole cache without a key)"""
+        self._subscriptions.setdefault(collection, []).append((cache, key_field))
+
+    async def start(self):
+        if os.getenv("CACHE_BUS_ENABLED", "true").lower() != "true" or self._tasks:
+            return
+        for collection in self._subscriptions:
+            ready = asyncio.Event()
+            self._ready.append(ready)
+            self._tasks.append(asyncio.create_task(self._watch(collection, ready), name=f"cache-bus:{collection}"))
+
+    async def wait_ready(self, timeout: float = 10):
+        """Wait until every stream is open (events before that are not seen)"""
+        await asyncio.wait_for(asyncio.gather(*[ready.wait() for ready in self._ready]), timeout)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._ready = []
+
+    def _pipeline(self, collection: str) -> List[dict]:
+        # Only the key fields travel with each event (and whether an update set them)
+        fields = {key_field for _, key_field in self._subscriptions[collection] if key_field}
+        return [{"$project": {
+            "operationType": 1, "documentKey": 1,
+            **{f"fullDocument.{field}": 1 for field in fields},
+            **{f"updateDescription.updatedFields.{field}": 1 for field in fields}
+        }}]
+
+    def _evict(self, collection: str, change: Optional[dict]):
+        change = change or {}
+        document = change.get("fullDocument") or {}
+        updated_fields = (change.get("updateDescription") or {}).get("updatedFields") or {}
+        for cache, key_field in self._subscriptions[collection]:
+            key = document.get(key_field) if key_field else None
+            # On a key change only the new key is known: entries under the old one
+            # (e.g. the previous owner's connections) can only go with a clear
+            if key_field in updated_fields or change.get("operationType") == "replace":
+                key = None
+            if key is None:
+                cache.clear()
+            else:
+                cache.delete(key)
+
+    async def _watch(self, collection: str, ready: asyncio.Event):
+        resume_token = None
+        while True:
+            try:
+                async with self.db[collection].watch(
+                    self._pipeline(collection),
+                    full_document="updateLookup",
+                    resume_after=resume_token
+                ) as stream:
+                    ready.set()
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self._evict(collection, change)
+                        if change["operationType"] in ("invalidate", "drop", "rename", "dropDatabase"):
+                            # The stream ends here and cannot be resumed past this event
+                            resume_token = None
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    logger.warning(f"Change streams unavailable, caches of {collection} rely on their TTL: {e}")
+                    ready.set()
+                    return
+                logger.error(f"Cache bus stream on {collection} failed: {e}")
+                resume_token = None
+            except PyMongoError as e:
+                logger.error(f"Cache bus stream on {collection} interrupted: {e}")
+
+            # Events may have been missed while the stream was down
+            self._evict(collection, None)
+            await asyncio.sleep(self.retry_seconds)
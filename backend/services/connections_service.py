@@ -0,0 +1,78 @@
+"""Connected social accounts overview, shared by the status endpoints
+
+One projected aggregation groups a user's active accounts by platform and
+account type; the result is cached per user for a few seconds and
+invalidated whenever accounts are connected, disconnected or re-defaulted.
+"""
+from typing import Dict, List
+import os
+
+from services.cache import TTLCache
+
+KNOWN_PLATFORMS = ["facebook", "instagram", "whatsapp", "linkedin"]
+
+connections_cache = TTLCache(
+    maxsize=int(os.getenv("CONNECTIONS_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("CONNECTIONS_CACHE_TTL_SECONDS", "30"))
+)
+
+
+def _build_pipeline(user_id: str) -> List[dict]:
+    return [
+        {"$match": {"user_id": user_id, "is_active": True}},
+        # Never read tokens back: only the public fields leave Mongo
+        {"$project": {
+            "_id": 0, "id": 1, "name": 1, "platform": 1, "account_type": 1,
+            "username": 1, "picture_url": 1, "is_default": 1, "quality_rating": 1
+        }},
+        {"$group": {
+            "_id": {"platform": "$platform", "account_type": "$account_type"},
+            "accounts": {"$push": {
+                "id": "$id",
+                "name": "$name",
+                "username": {"$ifNull": ["$username", None]},
+                "picture_url": {"$ifNull": ["$picture_url", None]},
+                "is_default": {"$ifNull": ["$is_default", False]},
+                "quality_rating": {"$ifNull": ["$quality_rating", None]}
+            }}
+        }}
+    ]
+
+
+async def get_connections(db, user_id: str) -> dict:
+    """Return the user's active accounts grouped by platform and account type
+
+    {"connected": bool, "platforms": {platform: {"connected": bool,
+     "account_types": {account_type: [account, ...]}}}}
+    """
+    cached = connections_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    platforms: Dict[str, dict] = {
+        platform: {"connected": False, "account_types": {}} for platform in KNOWN_PLATFORMS
+    }
+    async for group in db.social_accounts.aggregate(_build_pipeline(user_id)):
+        platform = group["_id"].get("platform")
+        account_type = group["_id"].get("account_type") or "default"
+        entry = platforms.setdefault(platform, {"connected": False, "account_types": {}})
+        entry["connected"] = True
+        entry["account_types"][account_type] = group["accounts"]
+
+    connections = {
+        "connected": any(p["connected"] for p in platforms.values()),
+        "platforms": platforms
+    }
+    connections_cache.set(user_id, connections)
+    return connections
+
+
+def get_platform_accounts(connections: dict, platform: str) -> List[dict]:
+    """Flatten the accounts of one platform, whatever their account type"""
+    account_types = connections["platforms"].get(platform, {}).get("account_types", {})
+    return [account for accounts in account_types.values() for account in accounts]
+
+
+def invalidate_connections(user_id: str):
+    """Drop the cached overview after accounts changed for `user_id`"""
+    connections_cache.delete(user_id)
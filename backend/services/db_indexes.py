@@ -0,0 +1,106 @@
+"""Declarative MongoDB index registry, applied at startup
+
+Every query shape used by the routes and services must be served by one of
+these indexes (see tests/test_query_indexes.py). Unique indexes back the
+places where the code assumes uniqueness (lookups and upserts by id / email /
+natural key).
+"""
+from typing import Dict, List
+import logging
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "social_accounts": [
+        # Account ids are derived from the platform id (`fb_page_<page id>`...),
+        # so two users connecting the same page share one: unique per user only
+        IndexModel([("user_id", ASCENDING), ("id", ASCENDING)], unique=True),
+        # Upsert key of connect / OAuth callbacks / discovery sync
+        IndexModel(
+            [("user_id", ASCENDING), ("platform", ASCENDING), ("platform_account_id", ASCENDING)],
+            unique=True
+        ),
+        # Active accounts of a user (by platform)
+        IndexModel([("user_id", ASCENDING), ("platform", ASCENDING), ("is_active", ASCENDING)]),
+        # Token refresh scan
+        IndexModel([("is_active", ASCENDING), ("token_expires_at", ASCENDING)]),
+    ],
+    "social_posts": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "status_checks": [
+        # Keyset pagination / streaming of /status, newest first
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "atc_wallets": [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+    ],
+    "atc_ledger": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("transaction_type", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "atc_purchases": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "atc_price_config": [
+        IndexModel([("is_active", ASCENDING)]),
+    ],
+    "atc_promos": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("is_active", ASCENDING), ("start_date", ASCENDING), ("end_date", ASCENDING)]),
+    ],
+    "atc_promo_views": [
+        IndexModel([("user_id", ASCENDING), ("promo_id", ASCENDING)]),
+    ],
+    "oauth_states": [
+        IndexModel([("state", ASCENDING)], unique=True),
+        # expireAfterSeconds=0: Mongo removes each document once `expires_at` is reached
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "revoked_tokens": [
+        IndexModel([("jti", ASCENDING)], unique=True),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        IndexModel([("revoked_at", ASCENDING)]),
+    ],
+}
+
+# Indexes replaced by the ones above, dropped at startup when still present
+OBSOLETE_INDEXES: Dict[str, List[str]] = {
+    "social_accounts": ["id_1"],
+}
+
+
+async def ensure_indexes(db) -> int:
+    """Create every registered index. Returns the number of failures
+
+    Indexes are created one by one so a conflict (e.g. duplicates blocking a
+    unique index on existing data) is logged without blocking the others.
+    """
+    failures = 0
+    for collection, names in OBSOLETE_INDEXES.items():
+        existing = await db[collection].index_information()
+        for name in names:
+            if name not in existing:
+                continue
+            try:
+                await db[collection].drop_index(name)
+            except OperationFailure as e:
+                failures += 1
+                logger.error(f"Could not drop obsolete index {name} on {collection}: {e}")
+    for collection, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                await db[collection].create_indexes([index])
+            except OperationFailure as e:
+                failures += 1
+                logger.error(f"Could not create index {index.document['key']} on {collection}: {e}")
+    return failures
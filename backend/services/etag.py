@@ -0,0 +1,52 @@
+"""Weak ETags and conditional GET for polled read endpoints
+
+The mobile app re-fetches its profile, wallet, ATC config and connections on
+every screen focus. Endpoints derive a weak validator from what versions
+their response (`updated_at`, balances, the current price, a cached
+overview...) and answer a matching `If-None-Match` with an empty 304 before
+building the response.
+
+    etag = weak_etag(wallet.id, wallet.updated_at, current_price)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+"""
+from typing import Any, Optional
+import hashlib
+
+import orjson
+from fastapi import Request, Response
+
+# Clients must revalidate, but may keep the body; never shared between users
+CACHE_CONTROL = "private, no-cache"
+
+
+def weak_etag(*parts: Any) -> str:
+    """Weak validator over JSON-serializable version parts"""
+    payload = orjson.dumps(parts, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return f'W/"{hashlib.blake2b(payload, digest_size=12).hexdigest()}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Weak comparison of `If-None-Match` against `etag` (RFC 9110 13.1.2)"""
+    header: Optional[str] = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = _opaque(etag)
+    return any(_opaque(candidate) == opaque for candidate in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
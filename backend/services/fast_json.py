@@ -0,0 +1,41 @@
+"""Fast serialization path for hot list endpoints
+
+Documents read from Mongo were written from our own models, so building a
+Pydantic model per document and letting FastAPI validate / encode the list
+again through `response_model` does the same work twice. List endpoints
+instead:
+
+- project exactly the fields of the response model (no `_id`, no secrets),
+- fill the model's static defaults for fields older documents lack,
+- encode the raw documents once with orjson (datetimes natively).
+
+The routes keep their `response_model` for the OpenAPI schema and return an
+`ORJSONResponse`, which bypasses the response_model validation.
+"""
+from typing import Any, Dict, Iterable, List, Type
+
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
+
+
+class DocumentShape:
+    """Projection and defaults of a response model, computed once per model"""
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self.projection: Dict[str, int] = {"_id": 0, **{name: 1 for name in model.model_fields}}
+        # Static defaults only: default factories (ids, timestamps) must come from the document
+        self.defaults: Dict[str, Any] = {
+            name: field.default
+            for name, field in model.model_fields.items()
+            if field.default is not PydanticUndefined and field.default_factory is None
+        }
+
+    def prepare(self, doc: dict) -> dict:
+        for name, default in self.defaults.items():
+            if name not in doc:
+                doc[name] = default
+        return doc
+
+    def prepare_all(self, docs: Iterable[dict]) -> List[dict]:
+        return [self.prepare(doc) for doc in docs]
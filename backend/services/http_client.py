@@ -0,0 +1,78 @@
+"""Outbound HTTP client factory
+
+Clients created here record their latency in
+`http_client_request_duration_seconds`, labelled by platform and a
+normalized endpoint (ids, URNs and other variable path segments are replaced
+by `{id}` so label cardinality stays bounded).
+"""
+from typing import Optional
+import re
+import time
+
+import httpx
+
+from services.metrics import http_client_request_duration
+
+PLATFORM_HOSTS = {
+    "graph.facebook.com": "meta",
+    "www.facebook.com": "meta",
+    "graph.instagram.com": "meta",
+    "api.linkedin.com": "linkedin",
+    "www.linkedin.com": "linkedin",
+}
+
+# Path segments that identify a resource rather than an endpoint
+_VARIABLE_SEGMENT = re.compile(r"^(\d+|urn:.*|.*\d.*\d.*\d.*|[0-9a-f-]{16,})$", re.IGNORECASE)
+_API_VERSION_SEGMENT = re.compile(r"^v\d+(\.\d+)?$")
+
+# Transport for clients created without one (benchmarks plug fake platform APIs here)
+_default_transport: Optional[httpx.AsyncBaseTransport] = None
+
+
+def set_default_transport(transport: Optional[httpx.AsyncBaseTransport]):
+    global _default_transport
+    _default_transport = transport
+
+
+def normalize_endpoint(path: str) -> str:
+    """`/v20.0/1234567/feed` -> `/v20.0/{id}/feed`"""
+    segments = []
+    for segment in path.strip("/").split("/"):
+        if segment and not _API_VERSION_SEGMENT.match(segment) and _VARIABLE_SEGMENT.match(segment):
+            segment = "{id}"
+        segments.append(segment)
+    return "/" + "/".join(segments)
+
+
+def _platform_for(request: httpx.Request, platform: Optional[str]) -> str:
+    return platform or PLATFORM_HOSTS.get(request.url.host, request.url.host)
+
+
+def create_http_client(platform: Optional[str] = None, **kwargs) -> httpx.AsyncClient:
+    """httpx.AsyncClient recording per-endpoint latency metrics"""
+
+    async def on_request(request: httpx.Request):
+        request.extensions["metrics_started_at"] = time.perf_counter()
+
+    async def on_response(response: httpx.Response):
+        request = response.request
+        started_at = request.extensions.get("metrics_started_at")
+        if started_at is None:
+            return
+        http_client_request_duration.labels(
+            platform=_platform_for(request, platform),
+            method=request.method,
+            endpoint=normalize_endpoint(request.url.path),
+            status=str(response.status_code)
+        ).observe(time.perf_counter() - started_at)
+
+    event_hooks = kwargs.pop("event_hooks", {})
+    if _default_transport is not None:
+        kwargs.setdefault("transport", _default_transport)
+    return httpx.AsyncClient(
+        event_hooks={
+            "request": [on_request, *event_hooks.get("request", [])],
+            "response": [on_response, *event_hooks.get("response", [])],
+        },
+        **kwargs
+    )
@@ -0,0 +1,208 @@
+"""Content-addressed image store for avatars and profile logos
+
+Images used to be stored as base64 strings inside user documents, so every
+user read carried them. They now live in GridFS (bucket `media`), named by
+the SHA-256 of their bytes, with pre-generated thumbnails; user documents only
+keep the resulting URLs (which embed the hash).
+
+Documents still holding inline base64 images are migrated when read.
+Values that cannot be migrated are left in place and marked with a
+fingerprint of the value (`avatar_migration_failed`, `logo_migration_failed`)
+so they are not retried on every read.
+"""
+from typing import Dict, Optional, Tuple
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from PIL import Image
+from gridfs.errors import NoFile
+
+logger = logging.getLogger(__name__)
+
+MEDIA_BUCKET = "media"
+MEDIA_ROUTE_PREFIX = "/api/media"
+THUMBNAIL_SIZES = [64, 256]
+MAX_IMAGE_BYTES = int(os.getenv("MEDIA_MAX_IMAGE_BYTES", str(5 * 1024 * 1024)))
+
+# Raw base64 (no data URI) only counts as an image when it is at least this
+# long and its first bytes are an image signature
+MIN_RAW_IMAGE_CHARS = 64
+IMAGE_SIGNATURES = (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n", b"GIF87a", b"GIF89a")
+
+
+class InvalidImageError(ValueError):
+    """Raised when an uploaded image cannot be decoded"""
+
+
+def is_inline_image(value: Optional[str]) -> bool:
+    """True for `data:image/...` URIs and raw base64 images still stored inline"""
+    if not value or value.startswith(("http://", "https://", f"{MEDIA_ROUTE_PREFIX}/")):
+        return False
+    if value.startswith("data:"):
+        return value.startswith("data:image/")
+    if len(value) < MIN_RAW_IMAGE_CHARS:
+        return False
+    try:
+        head = base64.b64decode(value[:16], validate=True)
+    except (binascii.Error, ValueError):
+        return False
+    return head.startswith(IMAGE_SIGNATURES) or (head[:4] == b"RIFF" and head[8:12] == b"WEBP")
+
+
+def _fingerprint(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()[:16]
+
+
+def _needs_migration(value: Optional[str], failed_fingerprint: Optional[str]) -> bool:
+    return is_inline_image(value) and failed_fingerprint != _fingerprint(value)
+
+
+def media_url(name: str) -> str:
+    base_url = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+    return f"{base_url}{MEDIA_ROUTE_PREFIX}/{name}"
+
+
+def _decode_inline_image(value: str) -> bytes:
+    if value.startswith("data:"):
+        value = value.partition(",")[2]
+    try:
+        data = base64.b64decode(value, validate=False)
+    except (binascii.Error, ValueError) as e:
+        raise InvalidImageError(str(e))
+    if not data:
+        raise InvalidImageError("Empty image")
+    if len(data) > MAX_IMAGE_BYTES:
+        raise InvalidImageError("Image trop volumineuse")
+    return data
+
+
+def _make_thumbnails(data: bytes) -> Tuple[str, Dict[int, bytes]]:
+    """Return the image content type (as detected by Pillow) and its thumbnails (PNG) by size"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            content_type = Image.MIME.get(image.format)
+            if not content_type or not content_type.startswith("image/"):
+                raise InvalidImageError(f"Unsupported image format {image.format}")
+            image.load()
+            thumbnails = {}
+            for size in THUMBNAIL_SIZES:
+                thumbnail = image.copy()
+                thumbnail.thumbnail((size, size))
+                if thumbnail.mode not in ("RGB", "RGBA"):
+                    thumbnail = thumbnail.convert("RGBA")
+                buffer = io.BytesIO()
+                thumbnail.save(buffer, format="PNG", optimize=True)
+                thumbnails[size] = buffer.getvalue()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise InvalidImageError(str(e))
+    return content_type, thumbnails
+
+
+async def _put_if_absent(bucket: AsyncIOMotorGridFSBucket, db, name: str, data: bytes, content_type: str):
+    if await db[f"{MEDIA_BUCKET}.files"].find_one({"filename": name}, {"_id": 1}):
+        return
+    await bucket.upload_from_stream(name, data, metadata={"content_type": content_type})
+
+
+async def store_image(db, value: str) -> dict:
+    """Store an inline image and its thumbnails, return their URLs
+
+    {"url": ..., "thumbnails": {"64": ..., "256": ...}}
+    """
+    data = _decode_inline_image(value)
+    digest = hashlib.sha256(data).hexdigest()
+
+    # Pillow decoding/resizing is CPU bound. The stored type is the one Pillow
+    # detected: the client-declared one is never trusted
+    content_type, thumbnails = await asyncio.get_running_loop().run_in_executor(
+        None, _make_thumbnails, data
+    )
+
+    bucket = AsyncIOMotorGridFSBucket(db, bucket_name=MEDIA_BUCKET)
+    await _put_if_absent(bucket, db, digest, data, content_type)
+    for size, thumbnail in thumbnails.items():
+        await _put_if_absent(bucket, db, f"{digest}_{size}", thumbnail, "image/png")
+
+    return {
+        "url": media_url(digest),
+        "thumbnails": {str(size): media_url(f"{digest}_{size}") for size in thumbnails},
+    }
+
+
+async def open_image(db, name: str) -> Optional[Tuple[bytes, str]]:
+    """Return (bytes, content type) of a stored image, or None"""
+    bucket = AsyncIOMotorGridFSBucket(db, bucket_name=MEDIA_BUCKET)
+    try:
+        stream = await bucket.open_download_stream_by_name(name)
+    except NoFile:
+        return None
+    data = await stream.read()
+    content_type = (stream.metadata or {}).get("content_type", "application/octet-stream")
+    return data, content_type
+
+
+async def offload_profile_logos(db, profiles: list) -> bool:
+    """Replace inline profile logos by stored image URLs (in place). Returns True if changed"""
+    changed = False
+    for profile in profiles:
+        if is_inline_image(profile.get("logo")):
+            stored = await store_image(db, profile["logo"])
+            profile["logo"] = stored["url"]
+            profile["logo_thumbnails"] = stored["thumbnails"]
+            changed = True
+    return changed
+
+
+async def migrate_user_images(db, user_doc: dict) -> dict:
+    """Read-time migration: move inline avatar / logos of a user document to the store
+
+    Only the migrated values are written, each guarded by its previous value:
+    a concurrent avatar or profiles update made during the upload wins.
+    """
+    user_doc = dict(user_doc)
+
+    avatar = user_doc.get("avatar")
+    if _needs_migration(avatar, user_doc.get("avatar_migration_failed")):
+        try:
+            stored = await store_image(db, avatar)
+            update = {"avatar": stored["url"], "avatar_thumbnails": stored["thumbnails"]}
+        except InvalidImageError as e:
+            # Left as is: a read must not destroy data
+            logger.warning(f"Could not migrate avatar of user {user_doc.get('id')}: {e}")
+            update = {"avatar_migration_failed": _fingerprint(avatar)}
+        await db.users.update_one({"id": user_doc["id"], "avatar": avatar}, {"$set": update})
+        user_doc.update(update)
+
+    profiles = user_doc.get("profiles") or []
+    logos = {
+        profile["logo"] for profile in profiles
+        if _needs_migration(profile.get("logo"), profile.get("logo_migration_failed"))
+    }
+    if logos:
+        # Per logo value, the fields to set on every profile still holding it
+        updates = {}
+        set_fields = {}
+        array_filters = []
+        for index, logo in enumerate(logos):
+            try:
+                stored = await store_image(db, logo)
+                updates[logo] = {"logo": stored["url"], "logo_thumbnails": stored["thumbnails"]}
+            except InvalidImageError as e:
+                logger.warning(f"Could not migrate a logo of user {user_doc.get('id')}: {e}")
+                updates[logo] = {"logo_migration_failed": _fingerprint(logo)}
+            for field, value in updates[logo].items():
+                set_fields[f"profiles.$[logo{index}].{field}"] = value
+            array_filters.append({f"logo{index}.logo": logo})
+
+        await db.users.update_one(
+            {"id": user_doc["id"]}, {"$set": set_fields}, array_filters=array_filters
+        )
+        user_doc["profiles"] = [{**profile, **updates.get(profile.get("logo"), {})} for profile in profiles]
+
+    return user_doc
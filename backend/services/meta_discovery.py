@@ -0,0 +1,132 @@
+"""Meta account discovery helpers used on (re)connect
+
+- `/me/accounts` responses are cached per Artywiz user together with their
+  ETag; reconnects send `If-None-Match` and reuse the cached page list on 304.
+  Only page ids and metadata are cached, never page access tokens: pages
+  served from the cache carry no `access_token`, so the synced accounts keep
+  the tokens already stored (unchanged, since the response was identical).
+- Discovered accounts are diffed against the stored `social_accounts` so only
+  new or changed documents are written, in a single `bulk_write`.
+"""
+from datetime import timedelta
+from typing import List, Optional, Tuple
+import logging
+import os
+
+import httpx
+from pymongo import UpdateOne
+
+from services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+GRAPH_API_VERSION = "v20.0"
+GRAPH_BASE_URL = f"https://graph.facebook.com/{GRAPH_API_VERSION}"
+
+PAGES_FIELDS = "id,name,access_token,picture,category,instagram_business_account{id,username,profile_picture_url,name}"
+
+# Fields that never count as a change on their own
+VOLATILE_FIELDS = {"connected_at", "token_expires_at"}
+# token_expires_at is only rewritten when it moves by more than this
+TOKEN_EXPIRY_SLACK = timedelta(days=1)
+
+discovery_cache = TTLCache(
+    maxsize=int(os.getenv("META_DISCOVERY_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("META_DISCOVERY_CACHE_TTL_SECONDS", "3600"))
+)
+
+
+async def fetch_pages(client: httpx.AsyncClient, access_token: str, user_id: str) -> Tuple[List[dict], bool]:
+    """Get the user's Pages (with linked Instagram accounts), conditionally when cached
+
+    Returns (pages, from_cache); pages from the cache have no `access_token`.
+    """
+    cached = discovery_cache.get(user_id)
+
+    headers = {}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+
+    response = await client.get(
+        f"{GRAPH_BASE_URL}/me/accounts",
+        params={"access_token": access_token, "fields": PAGES_FIELDS},
+        headers=headers
+    )
+
+    if response.status_code == 304 and cached:
+        logger.info(f"Meta pages unchanged for user {user_id}")
+        return [dict(page) for page in cached["pages"]], True
+
+    if response.status_code != 200:
+        return [], False
+
+    pages = response.json().get("data", [])
+    discovery_cache.set(user_id, {
+        "etag": response.headers.get("etag"),
+        "pages": [{key: value for key, value in page.items() if key != "access_token"} for page in pages]
+    })
+    return pages, False
+
+
+def _has_changed(stored: Optional[dict], account: dict) -> bool:
+    if stored is None:
+        return True
+
+    for field, value in account.items():
+        if field in VOLATILE_FIELDS:
+            continue
+        if stored.get(field) != value:
+            return True
+
+    stored_expiry = stored.get("token_expires_at")
+    new_expiry = account.get("token_expires_at")
+    if new_expiry and (not stored_expiry or abs(new_expiry - stored_expiry) > TOKEN_EXPIRY_SLACK):
+        return True
+
+    return False
+
+
+async def sync_social_accounts(db, user_id: str, accounts: List[dict]) -> int:
+    """Upsert discovered accounts, writing only the ones that changed
+
+    Accounts without an `access_token` (pages from the discovery cache) only
+    update stored documents. Returns the number of documents written.
+    """
+    if not accounts:
+        return 0
+
+    stored_docs = await db.social_accounts.find(
+        {
+            "user_id": user_id,
+            "platform": {"$in": list({a["platform"] for a in accounts})},
+            "platform_account_id": {"$in": [a["platform_account_id"] for a in accounts]}
+        },
+        {"_id": 0, **{field: 1 for account in accounts for field in account}}
+    ).to_list(len(accounts) * 2)
+    stored = {(d["platform"], d["platform_account_id"]): d for d in stored_docs}
+
+    # No token to create them with: removed since the page list was cached
+    missing = [
+        a for a in accounts
+        if "access_token" not in a and (a["platform"], a["platform_account_id"]) not in stored
+    ]
+    if missing:
+        logger.warning(f"Skipping {len(missing)} cached Meta accounts of user {user_id} no longer stored")
+        # The next connect fetches the full page list (with tokens) again
+        discovery_cache.delete(user_id)
+        accounts = [a for a in accounts if a not in missing]
+
+    operations = [
+        UpdateOne(
+            {"user_id": user_id, "platform": a["platform"], "platform_account_id": a["platform_account_id"]},
+            {"$set": a},
+            upsert=True
+        )
+        for a in accounts
+        if _has_changed(stored.get((a["platform"], a["platform_account_id"])), a)
+    ]
+
+    if operations:
+        await db.social_accounts.bulk_write(operations, ordered=False)
+    return len(operations)
+
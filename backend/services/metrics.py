@@ -0,0 +1,103 @@
+"""Prometheus metrics exposed on /metrics
+
+Labels are bounded: HTTP routes use their template (`/api/users/{user_id}`,
+never the raw path), Mongo commands their collection and command name, and
+outbound calls their platform and a normalized endpoint.
+
+The endpoint is not public: the scraper sends `Authorization: Bearer
+<METRICS_TOKEN>`, and without METRICS_TOKEN set it does not exist (404).
+"""
+from typing import Optional
+import hmac
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+
+from services import mongo_monitoring
+from services.password_service import password_hasher
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+mongo_command_duration = Histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command latency by collection and command",
+    ["collection", "command", "outcome"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+
+http_client_request_duration = Histogram(
+    "http_client_request_duration_seconds",
+    "Outbound HTTP latency by platform and endpoint",
+    ["platform", "method", "endpoint", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+
+def _observe_mongo_command(command: str, collection: str, duration: float, failed: bool):
+    mongo_command_duration.labels(
+        collection=collection or "-",
+        command=command,
+        outcome="failure" if failed else "success"
+    ).observe(duration)
+
+
+mongo_monitoring.command_monitor.add_observer(_observe_mongo_command)
+
+
+class _PoolCollector:
+    """Connection pool and password hashing gauges, read at scrape time"""
+
+    def collect(self):
+        pool_snapshot = mongo_monitoring.pool_monitor.snapshot()
+        gauges = {
+            name: GaugeMetricFamily(f"mongo_pool_{name}", f"MongoDB connection pool {name.replace('_', ' ')}", labels=["address"])
+            for name in ("open", "checked_out", "waiting", "saturation")
+        }
+        for address, pool in pool_snapshot["pools"].items():
+            for name, gauge in gauges.items():
+                if pool[name] is not None:
+                    gauge.add_metric([address], pool[name])
+        yield from gauges.values()
+
+        checkout_wait = pool_snapshot["checkout_wait"]
+        yield GaugeMetricFamily(
+            "mongo_pool_checkout_wait_avg_seconds",
+            "Average MongoDB connection checkout wait",
+            value=checkout_wait["avg_ms"] / 1000
+        )
+
+        hasher_stats = password_hasher.stats()
+        yield GaugeMetricFamily(
+            "password_hash_queue_depth",
+            "Password hashing operations waiting for a worker",
+            value=hasher_stats["queue_depth"]
+        )
+        yield GaugeMetricFamily(
+            "password_hash_active",
+            "Password hashing operations running",
+            value=hasher_stats["active"]
+        )
+
+
+REGISTRY.register(_PoolCollector())
+
+
+def scrape_allowed(authorization: Optional[str]) -> bool:
+    """True when `authorization` carries the configured METRICS_TOKEN"""
+    token = os.getenv("METRICS_TOKEN")
+    if not token or not authorization:
+        return False
+    return hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
+
+
+def render_latest() -> tuple:
+    """(body, content type) of the current metrics in Prometheus text format"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,66 @@
+"""Motor client factory, configured from the environment
+
+Unset variables keep the driver defaults. Pool sizing guide: each uvicorn
+worker has its own pool, so the server sees up to
+workers x MONGO_MAX_POOL_SIZE connections; watch `pool.saturation` and
+`pool.checkout_wait` on /api/health/db before raising it.
+"""
+from typing import Optional
+import logging
+import os
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from services.mongo_monitoring import command_monitor, pool_monitor
+
+logger = logging.getLogger(__name__)
+
+# pymongo's default maxPoolSize
+DEFAULT_MAX_POOL_SIZE = 100
+
+
+def _int_env(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def get_client_options() -> dict:
+    """Motor/pymongo keyword options from MONGO_* variables"""
+    options = {
+        "maxPoolSize": _int_env("MONGO_MAX_POOL_SIZE"),
+        "minPoolSize": _int_env("MONGO_MIN_POOL_SIZE"),
+        "maxIdleTimeMS": _int_env("MONGO_MAX_IDLE_TIME_MS"),
+        "maxConnecting": _int_env("MONGO_MAX_CONNECTING"),
+        "waitQueueTimeoutMS": _int_env("MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+        "serverSelectionTimeoutMS": _int_env("MONGO_SERVER_SELECTION_TIMEOUT_MS"),
+        "connectTimeoutMS": _int_env("MONGO_CONNECT_TIMEOUT_MS"),
+        "socketTimeoutMS": _int_env("MONGO_SOCKET_TIMEOUT_MS"),
+        # e.g. "zstd,snappy" (needs the zstandard / python-snappy packages; unavailable ones are skipped by pymongo)
+        "compressors": os.getenv("MONGO_COMPRESSORS"),
+        "zlibCompressionLevel": _int_env("MONGO_ZLIB_COMPRESSION_LEVEL"),
+        "readPreference": os.getenv("MONGO_READ_PREFERENCE"),
+        "readConcernLevel": os.getenv("MONGO_READ_CONCERN"),
+        "wTimeoutMS": _int_env("MONGO_WRITE_CONCERN_TIMEOUT_MS"),
+        "appname": os.getenv("MONGO_APP_NAME", "artywiz-backend"),
+    }
+
+    write_concern = os.getenv("MONGO_WRITE_CONCERN")
+    if write_concern:
+        options["w"] = int(write_concern) if write_concern.isdigit() else write_concern
+    journal = os.getenv("MONGO_WRITE_CONCERN_JOURNAL")
+    if journal:
+        options["journal"] = journal.lower() in ("1", "true", "yes")
+
+    return {key: value for key, value in options.items() if value is not None}
+
+
+def create_client(mongo_url: str, **overrides) -> AsyncIOMotorClient:
+    """Build the shared Motor client with monitoring listeners attached"""
+    options = {**get_client_options(), **overrides}
+    pool_monitor.max_pool_size = options.get("maxPoolSize", DEFAULT_MAX_POOL_SIZE)
+    logger.info(f"MongoDB client options: {options}")
+    return AsyncIOMotorClient(
+        mongo_url,
+        event_listeners=[command_monitor, pool_monitor],
+        **options
+    )
@@ -0,0 +1,225 @@
+"""MongoDB command and connection-pool instrumentation
+
+pymongo calls the listeners synchronously from the thread running the
+operation (Motor's executor threads), so all counters are lock protected and
+the callbacks only do constant-time bookkeeping.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+import threading
+import time
+
+from pymongo import monitoring
+
+# Latency histogram upper bounds, in milliseconds
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# Commands issued in the current context, when recording (see record_commands).
+# Motor copies the context into its executor threads, so listener callbacks see it.
+_recorded_commands: ContextVar[Optional[list]] = ContextVar("mongo_recorded_commands", default=None)
+
+
+@contextmanager
+def record_commands():
+    """Collect the (command_name, collection) of every command issued in this context"""
+    commands = []
+    token = _recorded_commands.set(commands)
+    try:
+        yield commands
+    finally:
+        _recorded_commands.reset(token)
+
+
+class _LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, duration_ms: float, failed: bool = False):
+        self.count += 1
+        self.failures += int(failed)
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if duration_ms <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "failures": self.failures,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "buckets": dict(zip([*map(str, LATENCY_BUCKETS_MS), "+Inf"], self.buckets)),
+        }
+
+
+def _command_collection(event) -> str:
+    target = event.command.get(event.command_name)
+    if isinstance(target, str):
+        return target
+    if event.command_name == "getMore":
+        return event.command.get("collection", "")
+    return ""
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """Per-command-name latency (find, insert, update, aggregate, ...)
+
+    Observers registered with `add_observer` are also called with
+    (command_name, collection, duration_seconds, failed) for every command.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _LatencyStats] = defaultdict(_LatencyStats)
+        # Collection of in-flight commands (only the started event carries the command)
+        self._collections: Dict[tuple, str] = {}
+        self._observers: List[Callable[[str, str, float, bool], None]] = []
+
+    def add_observer(self, observer: Callable[[str, str, float, bool], None]):
+        self._observers.append(observer)
+
+    def started(self, event):
+        recorded = _recorded_commands.get()
+        if recorded is not None:
+            recorded.append((event.command_name, _command_collection(event)))
+        if self._observers:
+            with self._lock:
+                self._collections[(event.connection_id, event.request_id)] = _command_collection(event)
+
+    def _finished(self, event, failed: bool):
+        with self._lock:
+            self._stats[event.command_name].observe(event.duration_micros / 1000, failed=failed)
+            collection = self._collections.pop((event.connection_id, event.request_id), "")
+        for observer in self._observers:
+            observer(event.command_name, collection, event.duration_micros / 1e6, failed)
+
+    def succeeded(self, event):
+        self._finished(event, failed=False)
+
+    def failed(self, event):
+        self._finished(event, failed=True)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in self._stats.items()}
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection pool usage: open / checked-out connections, checkout wait and failures"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Set by the client factory (pool events only carry non-default options)
+        self.max_pool_size: Optional[int] = None
+        self._pools: Dict[str, dict] = {}
+        self._checkout_wait = _LatencyStats()
+
+    def _pool(self, address) -> dict:
+        key = f"{address[0]}:{address[1]}"
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = {
+                "open": 0,
+                "checked_out": 0,
+                "waiting": 0,
+                "max_checked_out": 0,
+                "checkout_failures": defaultdict(int),
+                "cleared": 0,
+            }
+        return pool
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pool(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._pool(event.address)["cleared"] += 1
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop(f"{event.address[0]}:{event.address[1]}", None)
+
+    def connection_created(self, event):
+        with self._lock:
+            self._pool(event.address)["open"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._pool(event.address)["open"] -= 1
+
+    def connection_check_out_started(self, event):
+        # Checkout started / finished events fire on the same thread
+        self._local.checkout_started = time.perf_counter()
+        with self._lock:
+            self._pool(event.address)["waiting"] += 1
+
+    def _checkout_finished(self, event) -> dict:
+        started = getattr(self._local, "checkout_started", None)
+        self._local.checkout_started = None
+        pool = self._pool(event.address)
+        pool["waiting"] -= 1
+        if started is not None:
+            self._checkout_wait.observe((time.perf_counter() - started) * 1000)
+        return pool
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            pool = self._checkout_finished(event)
+            pool["checkout_failures"][event.reason] += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            pool = self._checkout_finished(event)
+            pool["checked_out"] += 1
+            pool["max_checked_out"] = max(pool["max_checked_out"], pool["checked_out"])
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._pool(event.address)["checked_out"] -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            pools = {}
+            for address, pool in self._pools.items():
+                pools[address] = {
+                    **pool,
+                    "checkout_failures": dict(pool["checkout_failures"]),
+                    # Share of the pool in use; 1.0 means checkouts start queueing
+                    "saturation": round(pool["checked_out"] / self.max_pool_size, 3)
+                    if self.max_pool_size else None,
+                }
+            return {
+                "max_pool_size": self.max_pool_size,
+                "checkout_wait": self._checkout_wait.as_dict(),
+                "pools": pools,
+            }
+
+
+command_monitor = CommandMonitor()
+pool_monitor = PoolMonitor()
+
+
+def snapshot() -> dict:
+    return {
+        "commands": command_monitor.snapshot(),
+        "pool": pool_monitor.snapshot(),
+    }
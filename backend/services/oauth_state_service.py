@@ -0,0 +1,133 @@
+"""OAuth state storage for Artywiz (CSRF protection of the OAuth dance)
+
+Two backends are available:
+- "mongo" (default): states live in the `oauth_states` collection, expired by a
+  TTL index and consumed atomically with a single `find_one_and_delete`.
+- "signed": states are self-contained HMAC-signed tokens, no database write on
+  `/start` and no lookup on `/callback`. They stay valid until they expire
+  (no single-use guarantee), which is the trade-off for zero Mongo traffic.
+
+Callbacks accept both formats, so switching OAUTH_STATE_STORE is safe while
+flows are in flight.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+from dotenv import load_dotenv
+from pathlib import Path
+
+from services.auth_service import SECRET_KEY
+
+load_dotenv(Path(__file__).parent.parent / '.env')
+
+STATE_TTL_MINUTES = 10
+SIGNED_STATE_PREFIX = "s1."
+
+
+def get_state_store_mode() -> str:
+    """Return the configured state backend ("mongo" or "signed")"""
+    return os.getenv("OAUTH_STATE_STORE", "mongo").lower()
+
+
+def _get_signing_key() -> bytes:
+    # Falls back to the JWT secret; set OAUTH_STATE_SECRET explicitly when
+    # several workers run without a shared JWT_SECRET_KEY.
+    return os.getenv("OAUTH_STATE_SECRET", SECRET_KEY).encode()
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(_get_signing_key(), payload.encode(), hashlib.sha256).digest()
+    return _b64encode(digest)
+
+
+def create_signed_state(user_id: str, redirect_uri: str, provider: str) -> str:
+    """Build a self-contained, HMAC-signed state token"""
+    payload = _b64encode(json.dumps({
+        "u": user_id,
+        "r": redirect_uri,
+        "p": provider,
+        "e": int(time.time()) + STATE_TTL_MINUTES * 60,
+        "n": secrets.token_urlsafe(8),
+    }, separators=(",", ":")).encode())
+    return f"{SIGNED_STATE_PREFIX}{payload}.{_sign(payload)}"
+
+
+def verify_signed_state(state: str, provider: Optional[str] = None) -> Optional[dict]:
+    """Verify a signed state token and return the stored flow data"""
+    try:
+        payload, signature = state[len(SIGNED_STATE_PREFIX):].split(".", 1)
+    except ValueError:
+        return None
+
+    # Compared as bytes: compare_digest rejects non-ASCII str with a TypeError
+    if not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+        return None
+
+    try:
+        data = json.loads(_b64decode(payload))
+    except (ValueError, json.JSONDecodeError):
+        return None
+
+    if data.get("e", 0) <= time.time():
+        return None
+    if provider and data.get("p") != provider:
+        return None
+
+    return {
+        "state": state,
+        "user_id": data["u"],
+        "redirect_uri": data["r"],
+        "provider": data["p"],
+    }
+
+
+async def create_state(db, user_id: str, redirect_uri: str, provider: str) -> str:
+    """Create a new OAuth state for the configured backend"""
+    if get_state_store_mode() == "signed":
+        return create_signed_state(user_id, redirect_uri, provider)
+
+    state = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    await db.oauth_states.insert_one({
+        "state": state,
+        "user_id": user_id,
+        "redirect_uri": redirect_uri,
+        "provider": provider,
+        "created_at": now,
+        "expires_at": now + timedelta(minutes=STATE_TTL_MINUTES)
+    })
+    return state
+
+
+async def consume_state(db, state: str, provider: Optional[str] = None) -> Optional[dict]:
+    """Validate and consume a state in a single round trip
+
+    Returns the stored flow data (user_id, redirect_uri...) or None when the
+    state is unknown, expired or already used.
+    """
+    if state.startswith(SIGNED_STATE_PREFIX):
+        return verify_signed_state(state, provider)
+
+    query = {
+        "state": state,
+        "expires_at": {"$gt": datetime.utcnow()}
+    }
+    if provider:
+        query["provider"] = provider
+
+    return await db.oauth_states.find_one_and_delete(query, projection={"_id": 0})
@@ -0,0 +1,51 @@
+"""Keyset pagination over (timestamp, id), newest first
+
+Pages are selected by "strictly after the last row returned", not by
+`skip`, so a page costs the same however deep it is and rows inserted
+meanwhile never shift or repeat entries. The position travels as an opaque,
+URL-safe continuation token.
+
+Rows without a timestamp (legacy documents) sort last; their cursor carries
+a null timestamp.
+"""
+from datetime import datetime
+from typing import Optional, Tuple
+import base64
+import binascii
+
+import orjson
+
+
+class InvalidCursor(ValueError):
+    """The continuation token was not produced by `encode_cursor`"""
+
+
+def encode_cursor(timestamp: Optional[datetime], id: str) -> str:
+    payload = orjson.dumps([timestamp.isoformat() if timestamp else None, id])
+    return base64.urlsafe_b64encode(payload).rstrip(b"=").decode()
+
+
+def decode_cursor(token: str) -> Tuple[Optional[datetime], str]:
+    try:
+        payload = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        timestamp, id = orjson.loads(payload)
+        return (datetime.fromisoformat(timestamp) if timestamp is not None else None), str(id)
+    except (binascii.Error, orjson.JSONDecodeError, TypeError, ValueError) as e:
+        raise InvalidCursor(str(e)) from e
+
+
+def keyset_filter(timestamp: Optional[datetime], id: str, timestamp_field: str = "timestamp", id_field: str = "id") -> dict:
+    """Rows after (timestamp, id) in (timestamp desc, id desc) order
+
+    Each `$or` branch is a bounded scan of the (timestamp, id) index. Rows
+    without a timestamp come after every dated row.
+    """
+    if timestamp is None:
+        return {timestamp_field: None, id_field: {"$lt": id}}
+    return {
+        "$or": [
+            {timestamp_field: {"$lt": timestamp}},
+            {timestamp_field: timestamp, id_field: {"$lt": id}},
+            {timestamp_field: None},
+        ]
+    }
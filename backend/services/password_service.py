@@ -0,0 +1,130 @@
+"""Password hashing off the event loop
+
+bcrypt costs ~200-300ms of CPU per call; running it inline in an async
+handler blocks every other request. Hashes and verifications run in a
+bounded thread pool instead (bcrypt releases the GIL), and the service keeps
+queue-depth counters so saturation is visible.
+
+Callers shed load by taking a slot with `try_reserve()` before hashing (and
+`release()` after): the check and the increment happen together, so
+concurrent requests cannot all pass a capacity check and then queue.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+import asyncio
+import os
+import threading
+import time
+
+from services.auth_service import pwd_context
+
+
+class PasswordHasher:
+    """Runs passlib bcrypt operations in a dedicated thread pool"""
+
+    def __init__(self, max_workers: Optional[int] = None, max_in_flight: Optional[int] = None):
+        self.max_workers = max_workers or int(
+            os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))
+        )
+        # Beyond this, callers should shed load instead of queueing
+        self.max_in_flight = max_in_flight or int(
+            os.getenv("PASSWORD_HASH_MAX_IN_FLIGHT", str(self.max_workers * 8))
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="password-hash"
+        )
+        self._lock = threading.Lock()
+        self._reserved = 0
+        self._submitted = 0
+        self._active = 0
+        self._completed = 0
+        self._max_queue_depth = 0
+        self._total_wait_seconds = 0.0
+        self._total_run_seconds = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """Operations submitted but not started yet"""
+        with self._lock:
+            return self._submitted - self._active - self._completed
+
+    @property
+    def in_flight(self) -> int:
+        """Operations queued or running"""
+        with self._lock:
+            return self._submitted - self._completed
+
+    @property
+    def saturated(self) -> bool:
+        """True when all `max_in_flight` slots are reserved"""
+        with self._lock:
+            return self._reserved >= self.max_in_flight
+
+    def try_reserve(self) -> bool:
+        """Take a slot for an upcoming operation; False when none is left"""
+        with self._lock:
+            if self._reserved >= self.max_in_flight:
+                return False
+            self._reserved += 1
+            return True
+
+    def release(self):
+        """Give back a slot taken with `try_reserve`"""
+        with self._lock:
+            self._reserved -= 1
+
+    def _timed(self, func, submitted_at: float, *args):
+        started_at = time.perf_counter()
+        with self._lock:
+            self._active += 1
+            self._total_wait_seconds += started_at - submitted_at
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._completed += 1
+                self._total_run_seconds += time.perf_counter() - started_at
+
+    async def _run(self, func, *args):
+        with self._lock:
+            self._submitted += 1
+            depth = self._submitted - self._active - self._completed
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self._timed, func, time.perf_counter(), *args
+        )
+
+    async def hash(self, password: str) -> str:
+        """Hash a password with the configured work factor"""
+        return await self._run(pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        """Verify a password against its hash"""
+        return await self._run(pwd_context.verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Verify a password and return a new hash when the stored one is outdated"""
+        return await self._run(pwd_context.verify_and_update, password, hashed_password)
+
+    def stats(self) -> dict:
+        with self._lock:
+            completed = self._completed
+            return {
+                "workers": self.max_workers,
+                "max_in_flight": self.max_in_flight,
+                "reserved": self._reserved,
+                "queue_depth": self._submitted - self._active - completed,
+                "active": self._active,
+                "completed": completed,
+                "max_queue_depth": self._max_queue_depth,
+                "avg_wait_ms": round(self._total_wait_seconds / completed * 1000, 2) if completed else 0.0,
+                "avg_run_ms": round(self._total_run_seconds / completed * 1000, 2) if completed else 0.0,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+password_hasher = PasswordHasher()
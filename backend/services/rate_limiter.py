@@ -0,0 +1,59 @@
+"""In-process sliding-window rate limiting"""
+from collections import OrderedDict, deque
+from typing import Hashable
+import threading
+import time
+
+
+class SlidingWindowLimiter:
+    """Allows at most `limit` hits per key over the last `window` seconds
+
+    Keys are kept in a bounded LRU so a flood of distinct keys cannot grow
+    memory without limit.
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = 100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._hits: "OrderedDict[Hashable, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prune(self, hits: deque, now: float):
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+
+    def hit(self, key: Hashable) -> bool:
+        """Record an attempt. Returns False (and records nothing) when over the limit"""
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                hits = self._hits[key] = deque()
+            self._hits.move_to_end(key)
+            self._prune(hits, now)
+            if len(hits) >= self.limit:
+                return False
+            hits.append(now)
+            while len(self._hits) > self.max_keys:
+                self._hits.popitem(last=False)
+            return True
+
+    def retry_after(self, key: Hashable) -> int:
+        """Seconds until `key` can hit again"""
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.get(key)
+            if not hits:
+                return 0
+            self._prune(hits, now)
+            if len(hits) < self.limit:
+                return 0
+            return max(1, int(hits[0] + self.window - now + 0.999))
+
+    def reset(self, key: Hashable):
+        with self._lock:
+            self._hits.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._hits)
@@ -2,11 +2,14 @@ from .base_publisher import BasePublisher, PublishResult
 from .facebook_publisher import FacebookPublisher
 from .instagram_publisher import InstagramPublisher
 from .linkedin_publisher import LinkedInPublisher
+from .rate_governor import RateGovernor, rate_governor
 
 __all__ = [
     'BasePublisher',
     'PublishResult',
     'FacebookPublisher',
     'InstagramPublisher',
-    'LinkedInPublisher'
+    'LinkedInPublisher',
+    'RateGovernor',
+    'rate_governor'
 ]
@@ -2,7 +2,8 @@ from abc import ABC, abstractmethod
 from typing import Optional, List
 from pydantic import BaseModel
 from datetime import datetime
-import httpx
+
+from services.http_client import create_http_client
 
 
 class PublishResult(BaseModel):
@@ -39,7 +40,7 @@ class BasePublisher(ABC):
     
     def __init__(self, access_token: str):
         self.access_token = access_token
-        self.http_client = httpx.AsyncClient(timeout=60.0)
+        self.http_client = create_http_client(self.PLATFORM_NAME, timeout=60.0)
     
     async def close(self):
         await self.http_client.aclose()
@@ -0,0 +1,52 @@
+from typing import Dict, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import time
+
+
+class RateGovernor:
+    """Caps concurrency and call rate of outbound calls per platform
+
+    Each platform gets a semaphore (max calls in flight) and a minimum
+    interval between two call starts, so background jobs never burst
+    through the Graph / LinkedIn API quotas.
+    """
+
+    DEFAULT_LIMITS = {
+        # platform: (max_concurrent, max_calls_per_second)
+        "facebook": (4, 10.0),
+        "instagram": (4, 10.0),
+        "linkedin": (2, 5.0),
+    }
+
+    def __init__(self, limits: Optional[Dict[str, tuple]] = None):
+        self.limits = {**self.DEFAULT_LIMITS, **(limits or {})}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._next_slot: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    def _get_semaphore(self, platform: str) -> asyncio.Semaphore:
+        if platform not in self._semaphores:
+            max_concurrent, _ = self.limits.get(platform, (2, 5.0))
+            self._semaphores[platform] = asyncio.Semaphore(max_concurrent)
+        return self._semaphores[platform]
+
+    async def _wait_for_slot(self, platform: str):
+        _, rate = self.limits.get(platform, (2, 5.0))
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(platform, now))
+            self._next_slot[platform] = slot + 1.0 / rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    @asynccontextmanager
+    async def acquire(self, platform: str):
+        """Hold a call slot for `platform` for the duration of the block"""
+        async with self._get_semaphore(platform):
+            await self._wait_for_slot(platform)
+            yield
+
+
+# Shared by every background job of the process
+rate_governor = RateGovernor()
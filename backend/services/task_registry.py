@@ -0,0 +1,75 @@
+"""In-flight work that must outlive its request, drained on shutdown
+
+Publishes and OAuth account writes run as registry tasks that the request
+awaits through `asyncio.shield`: a client disconnect, or uvicorn cancelling
+requests at its graceful-shutdown timeout, no longer cuts them off mid-way.
+
+On shutdown the registry stops accepting work, waits a bounded time
+(`SHUTDOWN_DRAIN_SECONDS` in server.py) for what is in flight, then cancels
+the rest and runs their checkpoint callbacks (e.g. put a post back to
+pending with the state needed to resume it).
+"""
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+Checkpoint = Callable[[], Awaitable[None]]
+
+
+class ShuttingDown(Exception):
+    """Raised when work is submitted after shutdown started"""
+
+
+class TaskRegistry:
+    """Tracks in-flight tasks and their checkpoints"""
+
+    def __init__(self):
+        self.accepting = True
+        self._tasks: Dict[asyncio.Task, Optional[Checkpoint]] = {}
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def spawn(self, coro, name: str, checkpoint: Optional[Checkpoint] = None) -> asyncio.Task:
+        if not self.accepting:
+            coro.close()
+            raise ShuttingDown(name)
+        task = asyncio.create_task(coro, name=name)
+        self._tasks[task] = checkpoint
+        task.add_done_callback(self._discard)
+        return task
+
+    async def run(self, coro, name: str, checkpoint: Optional[Checkpoint] = None):
+        """Run `coro` as a tracked task and return its result; cancelling the caller does not cancel it"""
+        return await asyncio.shield(self.spawn(coro, name, checkpoint))
+
+    def _discard(self, task: asyncio.Task):
+        self._tasks.pop(task, None)
+
+    async def drain(self, timeout: float) -> int:
+        """Stop accepting work, wait for in-flight tasks, checkpoint the ones cut off. Returns their count"""
+        self.accepting = False
+        pending = set(self._tasks)
+        if pending:
+            logger.info(f"Draining {len(pending)} in-flight tasks (up to {timeout}s)")
+            _, pending = await asyncio.wait(pending, timeout=timeout)
+
+        checkpoints = {task: self._tasks.get(task) for task in pending}
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        for task, checkpoint in checkpoints.items():
+            logger.warning(f"Task {task.get_name()} interrupted by shutdown")
+            if checkpoint is None:
+                continue
+            try:
+                await checkpoint()
+            except Exception as e:
+                logger.error(f"Checkpoint of {task.get_name()} failed: {e}")
+        return len(pending)
+
+
+task_registry = TaskRegistry()
@@ -0,0 +1,240 @@
+"""Proactive refresh of social account access tokens
+
+A background loop scans `social_accounts` for tokens expiring within a
+horizon, refreshes them in concurrent batches under the rate governor and
+writes the new tokens back with a single `bulk_write` per batch.
+
+Single-flight across workers: an account is claimed with an atomic
+`find_one_and_update` that sets `refresh_lease_until`; only the worker
+holding the lease refreshes it. Within a worker, accounts sharing the same
+access token (a Facebook Page and its Instagram account) share one call.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import os
+
+from pymongo import UpdateOne
+
+from services.social_media import FacebookPublisher, LinkedInPublisher, rate_governor
+
+logger = logging.getLogger(__name__)
+
+REFRESHABLE_PLATFORMS = ["facebook", "instagram", "linkedin"]
+
+# Assumed lifetime when a refresh response carries no `expires_in`
+# (long-lived Meta tokens and LinkedIn access tokens both last 60 days)
+DEFAULT_TOKEN_LIFETIME = {
+    "facebook": timedelta(days=60),
+    "instagram": timedelta(days=60),
+    "linkedin": timedelta(days=60),
+}
+
+# `_id` addresses the claimed document: account ids are only unique per user
+ACCOUNT_PROJECTION = {
+    "_id": 1, "id": 1, "platform": 1, "access_token": 1,
+    "refresh_token": 1, "token_expires_at": 1
+}
+
+
+def get_refresh_config() -> dict:
+    return {
+        "enabled": os.getenv("TOKEN_REFRESH_ENABLED", "true").lower() == "true",
+        "interval_seconds": int(os.getenv("TOKEN_REFRESH_INTERVAL_SECONDS", "900")),
+        "horizon_hours": int(os.getenv("TOKEN_REFRESH_HORIZON_HOURS", "72")),
+        "batch_size": int(os.getenv("TOKEN_REFRESH_BATCH_SIZE", "50")),
+        "lease_seconds": int(os.getenv("TOKEN_REFRESH_LEASE_SECONDS", "600")),
+    }
+
+
+class TokenRefreshScheduler:
+    """Background job refreshing social tokens before they expire"""
+
+    def __init__(self, db, config: Optional[dict] = None):
+        self.db = db
+        self.config = config or get_refresh_config()
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stopping = asyncio.Event()
+
+    async def start(self):
+        if not self.config["enabled"] or self._task:
+            return
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self, timeout: float = 0):
+        """Let the batch in progress be written back (up to `timeout` seconds), then cancel"""
+        if self._task:
+            self._stopping.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_forever(self):
+        while not self._stopping.is_set():
+            try:
+                refreshed = await self.run_once()
+                if refreshed:
+                    logger.info(f"Refreshed {refreshed} social account tokens")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Token refresh run failed: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.config["interval_seconds"])
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self) -> int:
+        """Refresh every due account, batch by batch. Returns the number refreshed
+
+        An account refreshed during this run is not claimed again by it, so the
+        run ends even if a platform hands back a token that is still due.
+        """
+        run_started = datetime.utcnow()
+        refreshed = 0
+        while True:
+            accounts = await self._claim_batch(run_started)
+            if not accounts:
+                return refreshed
+            results = await asyncio.gather(
+                *[self._refresh_account(account) for account in accounts]
+            )
+            operations = [op for op, _ in results if op is not None]
+            if operations:
+                await self.db.social_accounts.bulk_write(operations, ordered=False)
+            refreshed += sum(1 for _, success in results if success)
+            if len(accounts) < self.config["batch_size"] or self._stopping.is_set():
+                return refreshed
+
+    def _due_query(self, now: datetime, run_started: datetime) -> dict:
+        return {
+            "is_active": True,
+            "token_expires_at": {"$lte": now + timedelta(hours=self.config["horizon_hours"])},
+            "platform": {"$in": REFRESHABLE_PLATFORMS},
+            "$and": [
+                {"$or": [
+                    {"refresh_lease_until": {"$exists": False}},
+                    {"refresh_lease_until": {"$lte": now}}
+                ]},
+                # LinkedIn tokens can only be refreshed with a refresh token
+                {"$or": [
+                    {"platform": {"$ne": "linkedin"}},
+                    {"refresh_token": {"$nin": [None, ""]}}
+                ]},
+                {"$or": [
+                    {"token_refreshed_at": {"$exists": False}},
+                    {"token_refreshed_at": {"$lt": run_started}}
+                ]}
+            ]
+        }
+
+    async def _claim_batch(self, run_started: datetime) -> List[dict]:
+        now = datetime.utcnow()
+        candidates = await self.db.social_accounts.find(
+            self._due_query(now, run_started), {"_id": 1}
+        ).sort("token_expires_at", 1).limit(self.config["batch_size"]).to_list(self.config["batch_size"])
+
+        lease_until = now + timedelta(seconds=self.config["lease_seconds"])
+        claimed = await asyncio.gather(*[
+            self.db.social_accounts.find_one_and_update(
+                {"_id": candidate["_id"], **self._due_query(now, run_started)},
+                {"$set": {"refresh_lease_until": lease_until}},
+                projection=ACCOUNT_PROJECTION
+            )
+            for candidate in candidates
+        ])
+        # Accounts claimed meanwhile by another worker come back as None
+        return [account for account in claimed if account]
+
+    async def _refresh_account(self, account: dict) -> Tuple[Optional[UpdateOne], bool]:
+        """Refresh one claimed account and return its write-back operation"""
+        try:
+            token_data = await self._refresh_token_once(account)
+        except Exception as e:
+            logger.warning(f"Token refresh failed for account {account['id']}: {e}")
+            # The lease is kept so the account is retried after it expires
+            return UpdateOne(
+                {"_id": account["_id"]},
+                {"$set": {
+                    "token_refresh_error": str(e),
+                    "token_refresh_failed_at": datetime.utcnow()
+                }}
+            ), False
+
+        if not token_data or not token_data.get("access_token"):
+            return None, False
+
+        now = datetime.utcnow()
+        update = {
+            "access_token": token_data["access_token"],
+            "token_refreshed_at": now
+        }
+        if token_data.get("expires_in"):
+            update["token_expires_at"] = now + timedelta(seconds=int(token_data["expires_in"]))
+        else:
+            # Otherwise the old expiry stays and the account is due again at once
+            update["token_expires_at"] = now + DEFAULT_TOKEN_LIFETIME[account["platform"]]
+        if token_data.get("refresh_token"):
+            update["refresh_token"] = token_data["refresh_token"]
+
+        return UpdateOne(
+            {"_id": account["_id"]},
+            {
+                "$set": update,
+                "$unset": {
+                    "refresh_lease_until": "",
+                    "token_refresh_error": "",
+                    "token_refresh_failed_at": ""
+                }
+            }
+        ), True
+
+    async def _refresh_token_once(self, account: dict) -> Optional[dict]:
+        """Refresh a token, sharing the call between accounts using the same token"""
+        key = hashlib.sha256(account["access_token"].encode()).hexdigest()
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._call_platform(account)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # Mark as retrieved so a failure without waiters is not reported as unhandled
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _call_platform(self, account: dict) -> Optional[dict]:
+        platform = account["platform"]
+
+        if platform in ("facebook", "instagram"):
+            # Instagram Business accounts use the linked Page token
+            publisher = FacebookPublisher(account["access_token"])
+            refresh_with = account["access_token"]
+        elif platform == "linkedin":
+            publisher = LinkedInPublisher(account["access_token"])
+            refresh_with = account["refresh_token"]
+        else:
+            return None
+
+        try:
+            async with rate_governor.acquire(platform):
+                return await publisher.refresh_access_token(refresh_with)
+        finally:
+            await publisher.close()
@@ -0,0 +1,143 @@
+"""Refresh-token revocation
+
+Revoked (rotated or logged out) refresh-token `jti`s are stored in the
+`revoked_tokens` collection, expired by a TTL index once the token itself
+would have expired. Each worker mirrors them into an in-process Bloom filter
+refreshed by a periodic incremental sync, so the common case (token not
+revoked) is answered from memory and Mongo is only queried on a filter match.
+
+Revoking is an atomic insert on a unique `jti`: a refresh token presented
+twice (replay after rotation) fails even if the local filter is not synced yet.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import hashlib
+import logging
+import math
+import os
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys (no false negatives)"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.sha256(key.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+def get_revocation_config() -> dict:
+    return {
+        "capacity": int(os.getenv("REVOCATION_FILTER_CAPACITY", "200000")),
+        "error_rate": float(os.getenv("REVOCATION_FILTER_ERROR_RATE", "0.001")),
+        "sync_interval_seconds": int(os.getenv("REVOCATION_SYNC_INTERVAL_SECONDS", "30")),
+        "rebuild_interval_hours": int(os.getenv("REVOCATION_FILTER_REBUILD_HOURS", "24")),
+    }
+
+
+class TokenRevocationStore:
+    """Revoked refresh-token jtis, checked through a local Bloom filter"""
+
+    # Overlap between two incremental syncs, to absorb clock skew between workers
+    SYNC_OVERLAP = timedelta(seconds=5)
+
+    def __init__(self, db, config: Optional[dict] = None):
+        self.db = db
+        self.config = config or get_revocation_config()
+        self._filter = self._new_filter()
+        self._last_sync: Optional[datetime] = None
+        self._last_rebuild: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _new_filter(self) -> BloomFilter:
+        return BloomFilter(self.config["capacity"], self.config["error_rate"])
+
+    async def start(self):
+        await self.sync(full=True)
+        if not self._task:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_forever(self):
+        while True:
+            await asyncio.sleep(self.config["sync_interval_seconds"])
+            try:
+                rebuild_due = datetime.utcnow() - self._last_rebuild > timedelta(
+                    hours=self.config["rebuild_interval_hours"]
+                )
+                await self.sync(full=rebuild_due)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Revocation filter sync failed: {e}")
+
+    async def sync(self, full: bool = False):
+        """Load revocations into the filter (all live ones, or those since the last sync)"""
+        started_at = datetime.utcnow()
+        if full or self._last_sync is None:
+            query = {"expires_at": {"$gt": started_at}}
+            bloom = self._new_filter()
+        else:
+            query = {"revoked_at": {"$gte": self._last_sync - self.SYNC_OVERLAP}}
+            bloom = self._filter
+
+        async for doc in self.db.revoked_tokens.find(query, {"_id": 0, "jti": 1}):
+            bloom.add(doc["jti"])
+
+        # Swap only once fully loaded, so checks never see a partial filter
+        self._filter = bloom
+        self._last_sync = started_at
+        if full or self._last_rebuild is None:
+            self._last_rebuild = started_at
+
+    async def is_revoked(self, jti: str) -> bool:
+        """True if `jti` was revoked. Mongo is only read on a filter match"""
+        if jti not in self._filter:
+            return False
+        return await self.db.revoked_tokens.find_one({"jti": jti}, {"_id": 1}) is not None
+
+    async def revoke(self, jti: str, user_id: str, expires_at: datetime) -> bool:
+        """Revoke a refresh token. Returns False if it was already revoked"""
+        try:
+            await self.db.revoked_tokens.insert_one({
+                "jti": jti,
+                "user_id": user_id,
+                "expires_at": expires_at,
+                "revoked_at": datetime.utcnow()
+            })
+        except DuplicateKeyError:
+            return False
+        finally:
+            self._filter.add(jti)
+        return True
@@ -0,0 +1,80 @@
+"""Compare two benchmark result files and flag regressions
+
+    python -m tests.bench.compare baseline.json current.json \
+        --max-throughput-drop 0.10 --max-p99-increase 0.20
+
+Exits with status 1 when, at any concurrency level (overall or for any
+scenario), throughput dropped or p99 latency grew beyond the thresholds.
+"""
+from pathlib import Path
+import argparse
+import json
+import sys
+
+
+def _rows(results: dict):
+    for level in results["levels"]:
+        yield (level["concurrency"], "all"), level
+        for name, scenario in level["scenarios"].items():
+            yield (level["concurrency"], name), scenario
+
+
+def compare(baseline: dict, current: dict, max_throughput_drop: float, max_p99_increase: float) -> list:
+    """Return the comparison rows, each with a `regression` flag"""
+    baseline_rows = dict(_rows(baseline))
+    rows = []
+    for key, stats in _rows(current):
+        before = baseline_rows.get(key)
+        if before is None:
+            continue
+        throughput_change = (
+            (stats["throughput_rps"] - before["throughput_rps"]) / before["throughput_rps"]
+            if before["throughput_rps"] else 0.0
+        )
+        p99_change = (
+            (stats["latency_ms"]["p99"] - before["latency_ms"]["p99"]) / before["latency_ms"]["p99"]
+            if before["latency_ms"]["p99"] else 0.0
+        )
+        rows.append({
+            "concurrency": key[0],
+            "scenario": key[1],
+            "throughput_before": before["throughput_rps"],
+            "throughput_after": stats["throughput_rps"],
+            "throughput_change": throughput_change,
+            "p99_before": before["latency_ms"]["p99"],
+            "p99_after": stats["latency_ms"]["p99"],
+            "p99_change": p99_change,
+            "errors_after": stats["errors"],
+            "regression": throughput_change < -max_throughput_drop or p99_change > max_p99_increase,
+        })
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--max-throughput-drop", type=float, default=0.10)
+    parser.add_argument("--max-p99-increase", type=float, default=0.20)
+    args = parser.parse_args(argv)
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    current = json.loads(Path(args.current).read_text())
+    rows = compare(baseline, current, args.max_throughput_drop, args.max_p99_increase)
+
+    print(f"baseline {baseline['meta'].get('commit')} -> current {current['meta'].get('commit')}")
+    print(f"{'conc':>5} {'scenario':<10} {'rps before':>11} {'rps after':>10} {'Δ':>7} "
+          f"{'p99 before':>11} {'p99 after':>10} {'Δ':>7} {'errors':>6}")
+    for row in rows:
+        print(
+            f"{row['concurrency']:>5} {row['scenario']:<10} "
+            f"{row['throughput_before']:>11.1f} {row['throughput_after']:>10.1f} {row['throughput_change']:>+7.1%} "
+            f"{row['p99_before']:>11.2f} {row['p99_after']:>10.2f} {row['p99_change']:>+7.1%} "
+            f"{row['errors_after']:>6}{'  REGRESSION' if row['regression'] else ''}"
+        )
+
+    return 1 if any(row["regression"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""In-process fakes of the Graph (Facebook/Instagram) and LinkedIn APIs
+
+Plugged into every outbound client through
+`services.http_client.set_default_transport`, so publish / insights / OAuth
+code runs unchanged without network access. `latency` adds a fixed delay per
+call to approximate real upstream round trips.
+"""
+import asyncio
+import itertools
+from collections import Counter
+
+import httpx
+
+from services.http_client import normalize_endpoint
+
+
+class FakeSocialAPI:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._ids = itertools.count(1)
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        host = request.url.host
+        segments = [s for s in request.url.path.split("/") if s][1:]  # drop the API version
+        self.calls[f"{request.method} {host}{normalize_endpoint(request.url.path)}"] += 1
+
+        if host == "graph.facebook.com":
+            return self._graph(request, segments)
+        if host in ("api.linkedin.com", "www.linkedin.com"):
+            return self._linkedin(request, segments)
+        return httpx.Response(404, json={"error": {"message": f"Unknown host {host}"}})
+
+    def _graph(self, request: httpx.Request, segments: list) -> httpx.Response:
+        last = segments[-1] if segments else ""
+        if last == "access_token":
+            return httpx.Response(200, json={"access_token": "fake-long-lived", "expires_in": 5183944})
+        if last in ("photos", "feed", "media", "media_publish"):
+            return httpx.Response(200, json={"id": f"fake_{next(self._ids)}", "post_id": f"fake_{next(self._ids)}"})
+        if last == "insights":
+            return httpx.Response(200, json={"data": [
+                {"name": name, "values": [{"value": 10}]}
+                for name in ("impressions", "reach", "likes", "comments", "saved", "shares")
+            ]})
+        if request.url.params.get("fields") == "status_code":
+            return httpx.Response(200, json={"status_code": "FINISHED"})
+        # Post with likes / comments / shares / insights fields
+        return httpx.Response(200, json={
+            "likes": {"summary": {"total_count": 12}},
+            "comments": {"summary": {"total_count": 3}},
+            "shares": {"count": 2},
+            "insights": {"data": [
+                {"name": "post_impressions", "values": [{"value": 250}]},
+                {"name": "post_clicks", "values": [{"value": 17}]},
+                {"name": "post_reactions_by_type_total", "values": [{"value": {"like": 12}}]},
+            ]},
+        })
+
+    def _linkedin(self, request: httpx.Request, segments: list) -> httpx.Response:
+        last = segments[-1] if segments else ""
+        if last == "accessToken":
+            return httpx.Response(200, json={"access_token": "fake-linkedin", "expires_in": 5183999})
+        if request.method == "POST" and last == "posts":
+            return httpx.Response(201, json={"id": f"urn:li:share:{next(self._ids)}"})
+        return httpx.Response(200, json={
+            "likesSummary": {"totalLikes": 8},
+            "commentsSummary": {"totalFirstLevelComments": 1},
+            "elements": [],
+        })
@@ -0,0 +1,379 @@
+"""HTTP load-test / benchmark harness
+
+Boots the FastAPI app in-process behind an ASGI transport, seeds users,
+wallets, ledgers, social accounts and posts, then replays a weighted mix of
+login / wallet / ledger / publish / insights requests at fixed concurrency
+levels. Social platform calls go to in-process fakes. Results are written as
+JSON so runs can be compared across commits (see compare.py).
+
+Storage is mongomock-motor (in-memory) by default, or a real mongod with
+`--mongo-url` (a throwaway database is created and dropped).
+
+    python -m tests.bench.harness --concurrency 1,8,32 --requests 400 --output bench.json
+    python -m tests.bench.compare baseline.json bench.json
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+
+BACKEND_DIR = Path(__file__).resolve().parents[2] / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+DEFAULT_MIX = "login=1,wallet=4,ledger=3,publish=1,insights=1"
+
+# Admission control would otherwise reject the benchmark's own logins
+BENCH_ENV = {
+    "LOGIN_RATE_LIMIT_PER_EMAIL": "1000000",
+    "LOGIN_RATE_LIMIT_PER_IP": "1000000",
+}
+
+
+# ============================================================
+# SETUP
+# ============================================================
+
+def configure_env(bcrypt_rounds: Optional[int]):
+    """Must run before the backend modules are imported (they read env at import)"""
+    for key, value in BENCH_ENV.items():
+        os.environ.setdefault(key, value)
+    if bcrypt_rounds:
+        os.environ["BCRYPT_ROUNDS"] = str(bcrypt_rounds)
+
+
+def create_db(mongo_url: Optional[str]):
+    if mongo_url:
+        from services.mongo_client import create_client
+        client = create_client(mongo_url)
+        return client, client[f"bench_{uuid.uuid4().hex[:8]}"]
+
+    from mongomock_motor import AsyncMongoMockClient
+    client = AsyncMongoMockClient()
+    return client, client["bench"]
+
+
+async def build_app(db, upstream_latency: float = 0.0):
+    """The server app wired to `db`, with fake social APIs and no background jobs"""
+    import server
+    from routes import social_routes, auth_routes, atc_routes, users_routes, media_routes
+    from services import db_indexes
+    from services.http_client import set_default_transport
+    from services.token_revocation_service import TokenRevocationStore
+    from tests.bench.fake_social_api import FakeSocialAPI
+
+    for module in (social_routes, auth_routes, atc_routes, users_routes, media_routes):
+        module.set_db(db)
+    server.db = db
+
+    revocation_store = TokenRevocationStore(db)
+    await revocation_store.sync(full=True)
+    users_routes.set_revocation_store(revocation_store)
+
+    await db_indexes.ensure_indexes(db)
+
+    fake_api = FakeSocialAPI(latency=upstream_latency)
+    set_default_transport(fake_api.transport())
+    return server.app, fake_api
+
+
+async def seed(db, users: int, ledger_entries: int, posts: int) -> List[dict]:
+    """Insert benchmark users with their wallet, ledger, accounts and published posts"""
+    from models.atc_models import ATCLedgerEntry, ATCTransactionType, ATCWallet
+    from models.user import UserInDB
+    from services.auth_service import pwd_context
+
+    password = "bench-password"
+    hashed_password = pwd_context.hash(password)
+    now = datetime.utcnow()
+    contexts = []
+
+    for i in range(users):
+        user = UserInDB(email=f"bench{i}@example.com", name=f"Bench {i}", hashed_password=hashed_password)
+        await db.users.insert_one(user.model_dump())
+        await db.atc_wallets.insert_one(ATCWallet(user_id=user.id, balance_total=1000.0, balance_available=1000.0).model_dump())
+
+        if ledger_entries:
+            await db.atc_ledger.insert_many([
+                ATCLedgerEntry(
+                    user_id=user.id,
+                    transaction_type=ATCTransactionType.EARN_SPONSOR,
+                    amount=1.0,
+                    balance_after=float(n + 1),
+                    atc_price_eur=0.1,
+                    value_eur=0.1,
+                    created_at=now - timedelta(minutes=n)
+                ).model_dump()
+                for n in range(ledger_entries)
+            ])
+
+        accounts = []
+        for platform_name, account_type in (("facebook", "page"), ("linkedin", "company")):
+            account = {
+                "id": str(uuid.uuid4()),
+                "user_id": user.id,
+                "platform": platform_name,
+                "account_type": account_type,
+                "name": f"Bench {platform_name} {i}",
+                "access_token": "fake-token",
+                "platform_account_id": f"{platform_name}-{i}",
+                "urn": f"urn:li:organization:{i}" if platform_name == "linkedin" else None,
+                "is_active": True,
+                "connected_at": now,
+                "token_expires_at": now + timedelta(days=60),
+            }
+            await db.social_accounts.insert_one(account)
+            accounts.append(account)
+
+        post_ids = []
+        for n in range(posts):
+            account = accounts[n % len(accounts)]
+            post_id = str(uuid.uuid4())
+            await db.social_posts.insert_one({
+                "id": post_id,
+                "user_id": user.id,
+                "account_id": account["id"],
+                "platform": account["platform"],
+                "document_id": f"doc-{n}",
+                "content": "Bench post",
+                "platform_post_id": f"{n}",
+                "status": "published",
+                "created_at": now - timedelta(hours=n),
+                "published_at": now - timedelta(hours=n),
+            })
+            post_ids.append(post_id)
+
+        contexts.append({
+            "user_id": user.id,
+            "email": user.email,
+            "password": password,
+            "account_ids": [a["id"] for a in accounts],
+            "post_ids": post_ids,
+            "ledger_pages": max(1, ledger_entries // 20),
+        })
+
+    return contexts
+
+
+# ============================================================
+# SCENARIOS
+# ============================================================
+
+async def scenario_login(client, ctx, rng):
+    return await client.post("/api/users/login", json={"email": ctx["email"], "password": ctx["password"]})
+
+
+async def scenario_wallet(client, ctx, rng):
+    return await client.get(f"/api/atc/wallet/{ctx['user_id']}")
+
+
+async def scenario_ledger(client, ctx, rng):
+    page = rng.randint(1, ctx["ledger_pages"])
+    return await client.get(f"/api/atc/ledger/{ctx['user_id']}", params={"page": page, "page_size": 20})
+
+
+async def scenario_publish(client, ctx, rng):
+    return await client.post(
+        "/api/social/publish",
+        params={"user_id": ctx["user_id"]},
+        json={
+            "account_ids": ctx["account_ids"],
+            "document_id": f"doc-{rng.randint(0, 10000)}",
+            "caption": "Benchmark publication",
+            "image_url": "https://example.com/mockup.png"
+        }
+    )
+
+
+async def scenario_insights(client, ctx, rng):
+    post_id = rng.choice(ctx["post_ids"])
+    return await client.get(f"/api/social/insights/{post_id}", params={"user_id": ctx["user_id"]})
+
+
+SCENARIOS = {
+    "login": scenario_login,
+    "wallet": scenario_wallet,
+    "ledger": scenario_ledger,
+    "publish": scenario_publish,
+    "insights": scenario_insights,
+}
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r} (known: {', '.join(SCENARIOS)})")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+# ============================================================
+# RUNNER
+# ============================================================
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(samples: List[tuple], duration: float) -> dict:
+    """samples: (latency_seconds, ok)"""
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "throughput_rps": round(len(samples) / duration, 2) if duration else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(latencies[-1], 3) if latencies else 0.0,
+        },
+    }
+
+
+async def run_level(client, contexts: List[dict], weights: Dict[str, int], concurrency: int,
+                    total_requests: int, seed_value: int) -> dict:
+    names = list(weights)
+    rng = random.Random(seed_value)
+    # The request sequence is fixed by the seed, whatever the scheduling
+    plan = [(rng.choices(names, [weights[n] for n in names])[0], rng.choice(contexts), rng.random())
+            for _ in range(total_requests)]
+    samples: Dict[str, List[tuple]] = {name: [] for name in names}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < len(plan):
+            name, ctx, request_seed = plan[next_index]
+            next_index += 1
+            started_at = time.perf_counter()
+            try:
+                response = await SCENARIOS[name](client, ctx, random.Random(request_seed))
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            samples[name].append((time.perf_counter() - started_at, ok))
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    duration = time.perf_counter() - started_at
+
+    all_samples = [sample for name_samples in samples.values() for sample in name_samples]
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(duration, 3),
+        **summarize(all_samples, duration),
+        "scenarios": {name: summarize(name_samples, duration) for name, name_samples in samples.items() if name_samples},
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(concurrency_levels: List[int], requests_per_level: int, mix: str = DEFAULT_MIX,
+                        users: int = 20, ledger_entries: int = 100, posts: int = 10,
+                        mongo_url: Optional[str] = None, upstream_latency: float = 0.0,
+                        warmup: int = 20, seed_value: int = 42, bcrypt_rounds: Optional[int] = None) -> dict:
+    configure_env(bcrypt_rounds)
+    import httpx
+
+    weights = parse_mix(mix)
+    mongo_client, db = create_db(mongo_url)
+    try:
+        app, fake_api = await build_app(db, upstream_latency)
+        contexts = await seed(db, users, ledger_entries, posts)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60.0) as client:
+            if warmup:
+                await run_level(client, contexts, weights, 1, warmup, seed_value - 1)
+            levels = [
+                await run_level(client, contexts, weights, concurrency, requests_per_level, seed_value)
+                for concurrency in concurrency_levels
+            ]
+    finally:
+        if mongo_url:
+            await mongo_client.drop_database(db.name)
+        mongo_client.close()
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "storage": "mongod" if mongo_url else "mongomock",
+            "mix": weights,
+            "requests_per_level": requests_per_level,
+            "users": users,
+            "ledger_entries": ledger_entries,
+            "upstream_latency_s": upstream_latency,
+            "bcrypt_rounds": int(os.getenv("BCRYPT_ROUNDS", "12")),
+            "seed": seed_value,
+            "upstream_calls": dict(fake_api.calls),
+        },
+        "levels": levels,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=400, help="Requests per concurrency level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights, e.g. login=1,wallet=4")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--ledger-entries", type=int, default=100, help="Ledger entries per user")
+    parser.add_argument("--posts", type=int, default=10, help="Published posts per user")
+    parser.add_argument("--mongo-url", default=None, help="Use a real mongod instead of mongomock")
+    parser.add_argument("--upstream-latency", type=float, default=0.0, help="Fake platform API delay (s)")
+    parser.add_argument("--bcrypt-rounds", type=int, default=None, help="Override BCRYPT_ROUNDS")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run_benchmark(
+        concurrency_levels=[int(c) for c in args.concurrency.split(",")],
+        requests_per_level=args.requests,
+        mix=args.mix,
+        users=args.users,
+        ledger_entries=args.ledger_entries,
+        posts=args.posts,
+        mongo_url=args.mongo_url,
+        upstream_latency=args.upstream_latency,
+        warmup=args.warmup,
+        seed_value=args.seed,
+        bcrypt_rounds=args.bcrypt_rounds,
+    ))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Smoke run of the benchmark harness (tiny load, in-memory storage)"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("mongomock_motor")
+
+from tests.bench.compare import compare
+from tests.bench.harness import run_benchmark
+
+
+def test_harness_runs_every_scenario_without_errors():
+    results = asyncio.run(run_benchmark(
+        concurrency_levels=[1, 4],
+        requests_per_level=40,
+        users=3,
+        ledger_entries=40,
+        posts=4,
+        warmup=5,
+        bcrypt_rounds=4,
+    ))
+
+    assert [level["concurrency"] for level in results["levels"]] == [1, 4]
+    for level in results["levels"]:
+        assert level["requests"] == 40
+        assert level["errors"] == 0, level["scenarios"]
+        assert set(level["scenarios"]) == {"login", "wallet", "ledger", "publish", "insights"}
+
+    # A run compared with itself never regresses
+    assert not any(row["regression"] for row in compare(results, results, 0.1, 0.2))
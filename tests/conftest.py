@@ -0,0 +1,42 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Backend modules are imported as top-level packages (models, routes, services)
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+@pytest.fixture(scope="module")
+def mongo_app():
+    """(loop, app, db): the app wired to a throwaway database on MONGO_URL
+
+    Skips the module when no MongoDB is reachable. The database is dropped at
+    the end of the module.
+    """
+    url = os.getenv("MONGO_URL")
+    if not url:
+        pytest.skip("MONGO_URL not set")
+
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+    try:
+        MongoClient(url, serverSelectionTimeoutMS=2000).admin.command("ping")
+    except PyMongoError:
+        pytest.skip("MongoDB not reachable")
+
+    from tests.bench.harness import configure_env, create_db, build_app
+
+    configure_env(bcrypt_rounds=4)
+    loop = asyncio.new_event_loop()
+    mongo_client, db = create_db(url)
+    app, _ = loop.run_until_complete(build_app(db))
+
+    yield loop, app, db
+
+    loop.run_until_complete(mongo_client.drop_database(db.name))
+    mongo_client.close()
+    loop.close()
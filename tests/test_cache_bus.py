@@ -0,0 +1,121 @@
+"""Cache invalidation bus over change streams
+
+Writes made through another client (i.e. another worker) must evict the
+matching keys of the in-process caches. Needs a replica set (MONGO_URL, e.g.
+`mongod --replSet rs0` after `rs.initiate()`); skipped otherwise.
+"""
+from datetime import datetime, timedelta
+import asyncio
+import os
+import time
+import uuid
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def bus_env():
+    url = os.getenv("MONGO_URL")
+    if not url:
+        pytest.skip("MONGO_URL not set")
+
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+    other_worker = MongoClient(url, serverSelectionTimeoutMS=2000)
+    try:
+        hello = other_worker.admin.command("hello")
+    except PyMongoError:
+        pytest.skip("MongoDB not reachable")
+    if "setName" not in hello:
+        pytest.skip("change streams need a replica set")
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from services.cache import TTLCache
+    from services.cache_bus import CacheInvalidationBus
+
+    db_name = f"cache_bus_{uuid.uuid4().hex[:8]}"
+    loop = asyncio.new_event_loop()
+    client = AsyncIOMotorClient(url, io_loop=loop)
+    caches = {"users": TTLCache(), "social_accounts": TTLCache(), "atc_promos": TTLCache()}
+    bus = CacheInvalidationBus(client[db_name], retry_seconds=0.1)
+    bus.subscribe("users", caches["users"], key_field="id")
+    bus.subscribe("social_accounts", caches["social_accounts"], key_field="user_id")
+    bus.subscribe("atc_promos", caches["atc_promos"])
+
+    # Collections must exist before they can be watched
+    for name in caches:
+        other_worker[db_name][name].insert_one({"id": "seed", "user_id": "seed"})
+    loop.run_until_complete(bus.start())
+    loop.run_until_complete(bus.wait_ready())
+
+    yield loop, other_worker[db_name], caches
+
+    loop.run_until_complete(bus.stop())
+    other_worker.drop_database(db_name)
+    other_worker.close()
+    client.close()
+    loop.close()
+
+
+def wait_for(loop, condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        loop.run_until_complete(asyncio.sleep(0.05))
+    return condition()
+
+
+def test_user_update_evicts_only_that_principal(bus_env):
+    loop, other_db, caches = bus_env
+    other_db.users.insert_many([{"id": "u1", "name": "A"}, {"id": "u2", "name": "B"}])
+    caches["users"].set("u1", "principal u1")
+    caches["users"].set("u2", "principal u2")
+
+    other_db.users.update_one({"id": "u1"}, {"$set": {"name": "A2"}})
+
+    assert wait_for(loop, lambda: caches["users"].get("u1") is None)
+    assert caches["users"].get("u2") == "principal u2"
+
+
+def test_account_change_evicts_owner_connections(bus_env):
+    loop, other_db, caches = bus_env
+    caches["social_accounts"].set("u1", {"connected": False})
+
+    other_db.social_accounts.insert_one({"id": "a1", "user_id": "u1", "platform": "facebook", "is_active": True})
+
+    assert wait_for(loop, lambda: caches["social_accounts"].get("u1") is None)
+
+
+def test_delete_clears_whole_cache(bus_env):
+    loop, other_db, caches = bus_env
+    other_db.users.insert_one({"id": "u3"})
+    caches["users"].set("u3", "principal u3")
+    caches["users"].set("u4", "principal u4")
+
+    other_db.users.delete_one({"id": "u3"})
+
+    assert wait_for(loop, lambda: len(caches["users"]) == 0)
+
+
+def test_new_promo_clears_promo_cache(bus_env):
+    loop, other_db, caches = bus_env
+    caches["atc_promos"].set("unfinished", [])
+    now = datetime.utcnow()
+
+    other_db.atc_promos.insert_one({
+        "id": "p1", "is_active": True, "start_date": now, "end_date": now + timedelta(days=7)
+    })
+
+    assert wait_for(loop, lambda: caches["atc_promos"].get("unfinished") is None)
+
+
+def test_account_reassignment_evicts_previous_owner(bus_env):
+    loop, other_db, caches = bus_env
+    other_db.social_accounts.insert_one({"id": "a2", "user_id": "u5", "platform": "facebook", "is_active": True})
+    assert wait_for(loop, lambda: caches["social_accounts"].get("u5") is None)
+    caches["social_accounts"].set("u5", {"connected": True})
+
+    other_db.social_accounts.update_one({"id": "a2"}, {"$set": {"user_id": "u6"}})
+
+    assert wait_for(loop, lambda: caches["social_accounts"].get("u5") is None)
@@ -0,0 +1,109 @@
+"""Mongo round-trip budgets per endpoint
+
+Each request below is replayed against a real MongoDB (MONGO_URL) with
+command monitoring on, and must not issue more commands than its budget.
+Budgets are for a cold request: the in-process caches (principals, decoded
+tokens, connections) are cleared first. When a change legitimately lowers a
+count, lower the budget with it.
+
+Skipped when no MongoDB is reachable (command monitoring needs a real server).
+"""
+import uuid
+
+import pytest
+
+# (id, budget, request builder: ctx -> (method, url, kwargs))
+BUDGETS = [
+    ("register", 2, lambda ctx: ("POST", "/api/users/register", {"json": {
+        "email": f"new-{uuid.uuid4().hex[:8]}@example.com", "name": "New user", "password": "secret123"}})),
+    ("login", 2, lambda ctx: ("POST", "/api/users/login", {"json": {
+        "email": ctx["email"], "password": ctx["password"]}})),
+    ("refresh", 2, lambda ctx: ("POST", "/api/users/refresh", {"json": {
+        "refresh_token": ctx["fresh_refresh_token"]()}})),
+    ("me", 2, lambda ctx: ("GET", "/api/users/me", {"headers": ctx["auth"]})),
+    ("update me", 2, lambda ctx: ("PUT", "/api/users/me", {"headers": ctx["auth"], "json": {"phone": "0600000000"}})),
+    ("update themes", 2, lambda ctx: ("PUT", "/api/users/me/themes", {"headers": ctx["auth"], "json": {"themes": ["sport"]}})),
+    ("atc config", 2, lambda ctx: ("GET", "/api/atc/config", {})),
+    ("wallet", 2, lambda ctx: ("GET", f"/api/atc/wallet/{ctx['user_id']}", {})),
+    ("ledger page", 2, lambda ctx: ("GET", f"/api/atc/ledger/{ctx['user_id']}", {"params": {"page": 2}})),
+    ("create purchase", 2, lambda ctx: ("POST", "/api/atc/purchase", {
+        "params": {"user_id": ctx["user_id"]}, "json": {"amount_eur": 20}})),
+    ("confirm purchase", 4, lambda ctx: ("POST", f"/api/atc/purchase/{ctx['pending_purchase']()}/confirm", {})),
+    ("current promo", 1, lambda ctx: ("GET", "/api/atc/promo/current", {"params": {"user_id": ctx["user_id"]}})),
+    ("admin credit", 3, lambda ctx: ("POST", "/api/atc/admin/credit", {
+        "params": {"user_id": ctx["user_id"], "amount": 5, "description": "budget test"}})),
+    ("social accounts", 1, lambda ctx: ("GET", "/api/social/accounts", {"params": {"user_id": ctx["user_id"]}})),
+    ("publish history", 1, lambda ctx: ("GET", "/api/social/posts", {"params": {"user_id": ctx["user_id"]}})),
+    ("publish (2 accounts)", 8, lambda ctx: ("POST", "/api/social/publish", {
+        "params": {"user_id": ctx["user_id"]},
+        "json": {"account_ids": ctx["account_ids"], "document_id": "doc", "caption": "Budget", "image_url": "https://example.com/a.png"}})),
+    ("post insights", 3, lambda ctx: ("GET", f"/api/social/insights/{ctx['post_ids'][0]}", {"params": {"user_id": ctx["user_id"]}})),
+    ("connections", 1, lambda ctx: ("GET", "/api/auth/connections", {"params": {"user_id": ctx["user_id"]}})),
+    ("meta status", 1, lambda ctx: ("GET", "/api/auth/meta/status", {"params": {"user_id": ctx["user_id"]}})),
+]
+
+
+def clear_caches():
+    from routes.atc_routes import price_config_cache, promo_cache
+    from routes.users_routes import principal_cache
+    from services.auth_service import decoded_token_cache
+    from services.connections_service import connections_cache
+
+    for cache in (principal_cache, decoded_token_cache, connections_cache, price_config_cache, promo_cache):
+        cache.clear()
+
+
+async def build_context(db, client) -> dict:
+    """Seed one user and the helpers the request builders need"""
+    from tests.bench.harness import seed
+
+    ctx = (await seed(db, users=1, ledger_entries=60, posts=2))[0]
+    tokens = (await client.post("/api/users/login", json={"email": ctx["email"], "password": ctx["password"]})).json()
+    ctx["auth"] = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    refresh_tokens = []
+    for _ in range(5):
+        response = await client.post("/api/users/login", json={"email": ctx["email"], "password": ctx["password"]})
+        refresh_tokens.append(response.json()["refresh_token"])
+    ctx["fresh_refresh_token"] = refresh_tokens.pop
+
+    purchase_ids = []
+    for _ in range(5):
+        response = await client.post("/api/atc/purchase", params={"user_id": ctx["user_id"]}, json={"amount_eur": 20})
+        purchase_ids.append(response.json()["purchase_request_id"])
+    ctx["pending_purchase"] = purchase_ids.pop
+
+    return ctx
+
+
+@pytest.fixture(scope="module")
+def bench_env(mongo_app):
+    import httpx
+
+    loop, app, db = mongo_app
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://budget")
+    ctx = loop.run_until_complete(build_context(db, client))
+
+    yield loop, client, ctx
+
+    loop.run_until_complete(client.aclose())
+
+
+@pytest.mark.parametrize("budget,build_request", [b[1:] for b in BUDGETS], ids=[b[0] for b in BUDGETS])
+def test_route_stays_within_mongo_budget(bench_env, budget, build_request):
+    from services.mongo_monitoring import record_commands
+
+    loop, client, ctx = bench_env
+    method, url, kwargs = build_request(ctx)
+    clear_caches()
+
+    async def measure():
+        with record_commands() as commands:
+            response = await client.request(method, url, **kwargs)
+        return response, commands
+
+    response, commands = loop.run_until_complete(measure())
+    assert response.status_code < 400, response.text
+    assert len(commands) <= budget, (
+        f"{method} {url} issued {len(commands)} Mongo commands (budget {budget}): {commands}"
+    )
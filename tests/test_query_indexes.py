@@ -0,0 +1,110 @@
+"""Every query shape issued by the routes must be served by a registered index
+
+Runs `explain()` against a real MongoDB (MONGO_URL) and fails on COLLSCAN.
+Skipped when no server is reachable.
+"""
+from datetime import datetime
+import os
+import uuid
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from services.db_indexes import INDEXES
+from services.pagination import keyset_filter
+
+NOW = datetime.utcnow()
+
+# (description, collection, filter, sort)
+QUERY_SHAPES = [
+    # users_routes
+    ("user by id", "users", {"id": "u1"}, None),
+    ("user by email", "users", {"email": "a@b.co"}, None),
+    # social_routes
+    ("active accounts of a user", "social_accounts", {"user_id": "u1", "is_active": True}, None),
+    ("account by id", "social_accounts", {"id": "a1", "user_id": "u1", "is_active": True}, None),
+    ("account upsert key", "social_accounts",
+     {"user_id": "u1", "platform": "facebook", "platform_account_id": "p1"}, None),
+    ("meta accounts of a user", "social_accounts",
+     {"user_id": "u1", "platform": {"$in": ["facebook", "instagram"]}}, None),
+    ("tokens due for refresh", "social_accounts",
+     {"is_active": True, "token_expires_at": {"$lte": NOW}}, [("token_expires_at", 1)]),
+    ("publish history", "social_posts", {"user_id": "u1"}, [("created_at", -1)]),
+    ("published posts with insights", "social_posts",
+     {"user_id": "u1", "status": "published", "insights": {"$exists": True}}, None),
+    ("post by id", "social_posts", {"id": "p1", "user_id": "u1", "status": "published"}, None),
+    # atc_routes
+    ("active price config", "atc_price_config", {"is_active": True}, None),
+    ("wallet", "atc_wallets", {"user_id": "u1"}, None),
+    ("unfinished promos", "atc_promos", {"is_active": True, "end_date": {"$gte": NOW}}, None),
+    ("promo by id", "atc_promos", {"id": "p1"}, None),
+    ("ledger page", "atc_ledger", {"user_id": "u1"}, [("created_at", -1)]),
+    ("ledger page by type", "atc_ledger", {"user_id": "u1", "transaction_type": "purchase"}, [("created_at", -1)]),
+    ("purchase by id", "atc_purchases", {"id": "p1"}, None),
+    ("promo view", "atc_promo_views", {"user_id": "u1", "promo_id": "p1"}, None),
+    # server
+    ("status checks page", "status_checks", {}, [("timestamp", -1), ("id", -1)]),
+    ("status checks after cursor", "status_checks", keyset_filter(NOW, "s1"), [("timestamp", -1), ("id", -1)]),
+    ("status checks after undated cursor", "status_checks", keyset_filter(None, "s1"), [("timestamp", -1), ("id", -1)]),
+    # services
+    ("oauth state", "oauth_states", {"state": "s1", "expires_at": {"$gt": NOW}}, None),
+    ("revoked jti", "revoked_tokens", {"jti": "j1"}, None),
+    ("revocations since", "revoked_tokens", {"revoked_at": {"$gte": NOW}}, None),
+]
+
+
+@pytest.fixture(scope="module")
+def mongo_db():
+    url = os.getenv("MONGO_URL")
+    if not url:
+        pytest.skip("MONGO_URL not set")
+    client = MongoClient(url, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        pytest.skip("MongoDB not reachable")
+
+    db = client[f"test_query_indexes_{uuid.uuid4().hex[:8]}"]
+    for collection, indexes in INDEXES.items():
+        db[collection].create_indexes(indexes)
+    yield db
+    client.drop_database(db.name)
+    client.close()
+
+
+def _stages(plan):
+    """All `stage` names of an explain plan tree"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stages(value)
+
+
+@pytest.mark.parametrize(
+    "collection,query,sort",
+    [shape[1:] for shape in QUERY_SHAPES],
+    ids=[shape[0] for shape in QUERY_SHAPES]
+)
+def test_query_uses_an_index(mongo_db, collection, query, sort):
+    command = {"find": collection, "filter": query}
+    if sort:
+        command["sort"] = dict(sort)
+    explain = mongo_db.command("explain", command, verbosity="queryPlanner")
+    winning_plan = explain["queryPlanner"]["winningPlan"]
+    assert "COLLSCAN" not in set(_stages(winning_plan)), winning_plan
+
+
+def test_connections_aggregation_uses_an_index(mongo_db):
+    from services.connections_service import _build_pipeline
+
+    explain = mongo_db.command(
+        "explain",
+        {"aggregate": "social_accounts", "pipeline": _build_pipeline("u1"), "cursor": {}},
+        verbosity="queryPlanner"
+    )
+    assert "COLLSCAN" not in set(_stages(explain))
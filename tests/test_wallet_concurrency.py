@@ -0,0 +1,81 @@
+"""Concurrent wallet mutations must not lose updates
+
+Fires many credits (and duplicate purchase confirmations) at the same wallet
+at once against a real MongoDB (MONGO_URL). Skipped when none is reachable.
+"""
+import asyncio
+import uuid
+
+import pytest
+
+CONCURRENT_CREDITS = 200
+
+
+@pytest.fixture(scope="module")
+def wallet_env(mongo_app):
+    import httpx
+
+    loop, app, db = mongo_app
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://wallet",
+        limits=httpx.Limits(max_connections=CONCURRENT_CREDITS)
+    )
+
+    yield loop, client, db
+
+    loop.run_until_complete(client.aclose())
+
+
+def test_concurrent_credits_are_all_applied(wallet_env):
+    loop, client, db = wallet_env
+    user_id = f"wallet-{uuid.uuid4().hex[:8]}"  # no wallet yet: the first credits race to create it
+
+    async def credit_all():
+        return await asyncio.gather(*[
+            client.post("/api/atc/admin/credit", params={"user_id": user_id, "amount": 1, "description": "concurrency"})
+            for _ in range(CONCURRENT_CREDITS)
+        ])
+
+    responses = loop.run_until_complete(credit_all())
+    assert all(r.status_code == 200 for r in responses), [r.text for r in responses if r.status_code != 200][:3]
+
+    wallets = loop.run_until_complete(db.atc_wallets.find({"user_id": user_id}).to_list(None))
+    assert len(wallets) == 1
+    assert wallets[0]["balance_total"] == CONCURRENT_CREDITS
+    assert wallets[0]["balance_locked"] == CONCURRENT_CREDITS
+    assert wallets[0]["total_earned"] == CONCURRENT_CREDITS
+
+    # Each ledger entry saw exactly the balance its own credit produced
+    entries = loop.run_until_complete(db.atc_ledger.find({"user_id": user_id}).to_list(None))
+    assert sorted(e["balance_after"] for e in entries) == [float(n) for n in range(1, CONCURRENT_CREDITS + 1)]
+
+
+def test_purchase_is_credited_once(wallet_env):
+    loop, client, db = wallet_env
+    user_id = f"wallet-{uuid.uuid4().hex[:8]}"
+
+    async def confirm_concurrently():
+        created = await client.post("/api/atc/purchase", params={"user_id": user_id}, json={"amount_eur": 20})
+        purchase_id = created.json()["purchase_request_id"]
+        return await asyncio.gather(*[client.post(f"/api/atc/purchase/{purchase_id}/confirm") for _ in range(20)])
+
+    responses = loop.run_until_complete(confirm_concurrently())
+    assert sorted(r.status_code for r in responses) == [200] + [400] * 19
+
+    credited = responses[[r.status_code for r in responses].index(200)].json()["new_balance"]
+    wallet = loop.run_until_complete(db.atc_wallets.find_one({"user_id": user_id}))
+    assert wallet["balance_total"] == wallet["total_purchased"] == credited
+    assert loop.run_until_complete(db.atc_ledger.count_documents({"user_id": user_id})) == 1
+
+
+def test_concurrent_first_reads_create_one_wallet(wallet_env):
+    loop, client, db = wallet_env
+    user_id = f"wallet-{uuid.uuid4().hex[:8]}"  # no wallet yet: every read races to create it
+
+    async def read_all():
+        return await asyncio.gather(*[client.get(f"/api/atc/wallet/{user_id}") for _ in range(50)])
+
+    responses = loop.run_until_complete(read_all())
+    assert all(r.status_code == 200 for r in responses), [r.text for r in responses if r.status_code != 200][:3]
+    assert len({r.json()["id"] for r in responses}) == 1
+    assert loop.run_until_complete(db.atc_wallets.count_documents({"user_id": user_id})) == 1